@@ -1,20 +1,90 @@
+# Import json to read EXPLAIN output
+import json
 # Import Django admin and GeoDjango's OpenStreetMap admin
 from django.contrib import admin
 from django.contrib.gis.admin import OSMGeoAdmin
+# Import paginator base class and database connection for count estimates
+from django.core.paginator import Paginator
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+# Import bounding box parser shared with the API
+from .grid import parse_bbox
 # Import our models
-from .models import Business, BusinessCategory, ServiceArea
+from .models import Business, BusinessCategory, Job, ServiceArea
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids exact COUNT(*) on large tables
+
+    Unfiltered lists use the planner's row estimate from pg_class; filtered lists use the
+    row estimate from EXPLAIN. Only when the estimate is small is an exact count run.
+    """
+    # Below this many rows an exact COUNT(*) is cheap enough to run
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where:
+            # Unfiltered: read the table's row estimate kept up to date by ANALYZE/autovacuum
+            # Autovacuum never analyzes a partitioned table itself, so sum its partitions
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT CASE WHEN c.relkind = 'p' THEN (
+                        SELECT COALESCE(SUM(GREATEST(part.reltuples, 0)), 0)
+                        FROM pg_inherits i JOIN pg_class part ON part.oid = i.inhrelid
+                        WHERE i.inhparent = c.oid
+                    ) ELSE c.reltuples END::bigint
+                    FROM pg_class c WHERE c.oid = %s::regclass
+                    """,
+                    [self.object_list.model._meta.db_table],
+                )
+                estimate = cursor.fetchone()[0]
+        else:
+            # Filtered: ask the planner how many rows it expects
+            plan = json.loads(self.object_list.explain(format="json"))
+            estimate = plan[0]["Plan"]["Plan Rows"]
+        # reltuples is -1 for tables that have never been analyzed
+        if estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+
+class BoundingBoxFilter(admin.SimpleListFilter):
+    """
+    Sidebar filter for businesses inside a map viewport
+
+    Filter with ?bbox=min_lon,min_lat,max_lon,max_lat (e.g. copied from the map page);
+    uses the GIST index on location instead of listing choices from the database.
+    """
+    title = "viewport"
+    parameter_name = "bbox"
+
+    def lookups(self, request, model_admin):
+        # Offer the current viewport (if any) as the only choice - nothing is queried
+        value = self.value()
+        return [(value, value)] if value and parse_bbox(value) else []
+
+    def queryset(self, request, queryset):
+        bbox = parse_bbox(self.value()) if self.value() else None
+        if bbox:
+            return queryset.filter(location__within=bbox)
+        return queryset
 
 
 @admin.register(BusinessCategory)
 class BusinessCategoryAdmin(admin.ModelAdmin):
     """
     Admin configuration for BusinessCategory model
-    
+
     Simple admin interface for managing business categories with search functionality.
     """
     # Fields to display in the list view
     list_display = ("name", "slug")
-    # Fields that can be searched in the admin interface
+    # Fields that can be searched in the admin interface (also used by autocomplete widgets)
     search_fields = ("name", "slug")
 
 
@@ -22,29 +92,88 @@ class BusinessCategoryAdmin(admin.ModelAdmin):
 class ServiceAreaAdmin(OSMGeoAdmin):
     """
     Admin configuration for ServiceArea model with map integration
-    
+
     Uses OSMGeoAdmin to provide an OpenStreetMap interface for drawing and editing polygons.
     """
     # Fields to display in the list view
     list_display = ("name", "created_at")
-    # Fields that can be searched in the admin interface
+    # Fields that can be searched in the admin interface (also used by autocomplete widgets)
     search_fields = ("name",)
+    # Use estimated counts and skip the extra unfiltered COUNT(*) on the changelist
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Business)
 class BusinessAdmin(OSMGeoAdmin):
     """
     Admin configuration for Business model with map-based location editing
-    
+
     Uses OSMGeoAdmin to provide an OpenStreetMap interface for setting business locations.
+    Tuned for large tables: estimated counts, autocomplete widgets for foreign keys,
+    trigram-indexed name search and filters that never enumerate every service area.
     """
     # Fields to display in the list view
     list_display = ("name", "category", "service_area", "created_at")
+    # Load category and service area with the businesses in one query
+    list_select_related = ("category", "service_area")
     # Add filters on the right sidebar for these fields
-    list_filter = ("category", "service_area")
+    # Service areas are filtered by set/unset rather than listing every area
+    list_filter = ("category", ("service_area", admin.EmptyFieldListFilter), BoundingBoxFilter)
     # Fields that can be searched in the admin interface
-    search_fields = ("name", "description", "category__name")
+    # name and description are covered by their trigram indexes on UPPER(...), external_id
+    # by its unique index; category is narrowed with the sidebar filter instead of a join
+    search_fields = ("name", "description", "=external_id")
+    # Search foreign keys as you type instead of rendering every option in a dropdown
+    autocomplete_fields = ("category", "service_area")
+    # Use estimated counts and skip the extra unfiltered COUNT(*) on the changelist
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Order by primary key so pages are read straight off the index
+    ordering = ("-id",)
     # Default map view centered on Dublin, Ireland
     default_lon = -6.2603
     default_lat = 53.3498
-    default_zoom = 12
\ No newline at end of file
+    default_zoom = 12
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for background jobs
+
+    Read-only view of the job queue with progress and errors; failed jobs can be retried.
+    Jobs are queued by the application and run by "python manage.py run_workers".
+    """
+    # Fields to display in the list view
+    list_display = ("kind", "status", "progress_percent", "progress_message", "attempts", "run_after", "worker", "finished_at")
+    # Add filters on the right sidebar for these fields
+    list_filter = ("status", "kind")
+    # Find the jobs for a particular object, e.g. "recompute_service_area:3"
+    search_fields = ("=dedup_key",)
+    # Jobs are only changed by workers
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ["retry_jobs"]
+    # Use estimated counts and skip the extra unfiltered COUNT(*) on the changelist
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="progress")
+    def progress_percent(self, job):
+        return f"{job.progress:.0%}"
+
+    @admin.action(description="Retry selected failed jobs")
+    def retry_jobs(self, request, queryset):
+        retried = 0
+        for job in queryset.filter(status=Job.FAILED):
+            try:
+                with transaction.atomic():
+                    Job.objects.filter(pk=job.pk).update(status=Job.PENDING, attempts=0, run_after=timezone.now())
+                retried += 1
+            except IntegrityError:
+                # An identical job is already pending
+                pass
+        self.message_user(request, f"Queued {retried} jobs for retry.")
@@ -11,4 +11,8 @@ class LbsAppConfig(AppConfig):
     # Use BigAutoField as the default primary key type
     default_auto_field = "django.db.models.BigAutoField"
     # Name of the application
-    name = "lbs_app"
\ No newline at end of file
+    name = "lbs_app"
+
+    def ready(self):
+        # Register signal handlers that keep derived Business columns in sync
+        from . import signals  # noqa: F401
@@ -0,0 +1,191 @@
+# Import transaction helper so a whole batch is written atomically
+from django.db import transaction
+from django.utils import timezone
+
+# Import our models
+from .models import Business
+# Import the partitioning switch (partitioned tables can't upsert on external_id alone)
+from .partitioning import partitioning_enabled
+# Import the job queue for service area assignment after the write
+from .jobs import enqueue
+# Import the reference cache for checking category and service area ids
+from .reference_cache import reference_cache
+# Import the serializer that validates individual bulk records
+from .serializers import BusinessBulkItemSerializer
+
+
+# Maximum number of records accepted in one bulk request
+BULK_MAX_RECORDS = 1000
+
+# Business fields written by bulk create/update/upsert
+# updated_at, grid cells and region are included because bulk writes skip save() and signals
+BULK_WRITE_FIELDS = [
+    "name",
+    "description",
+    "phone",
+    "email",
+    "website",
+    "location",
+    "category_id",
+    "service_area_id",
+    "updated_at",
+    "grid_cell_1",
+    "grid_cell_2",
+    "grid_cell_3",
+    "region",
+]
+
+# Fields set on every write, whatever the record contains
+BULK_DERIVED_FIELDS = {"updated_at", "grid_cell_1", "grid_cell_2", "grid_cell_3", "region"}
+
+
+def _build_business(data, instance=None):
+    """
+    Copy validated record data onto a (new or existing) Business instance
+    """
+    business = instance or Business()
+    for field, value in data.items():
+        if field != "id":
+            setattr(business, field, value)
+    business.updated_at = timezone.now()
+    # Bulk writes bypass the pre_save signal, so assign grid cells and region here
+    business.assign_grid_cells()
+    business.assign_region()
+    return business
+
+
+def _upsert_fields(data):
+    """
+    Return the fields an upsert record overwrites on an existing row
+
+    Optional fields missing from the record (description, phone, service_area_id...)
+    keep their stored values, as they do when updating by id.
+    """
+    return tuple(field for field in BULK_WRITE_FIELDS if field in data or field in BULK_DERIVED_FIELDS)
+
+
+def bulk_write_businesses(records):
+    """
+    Create, update or upsert a batch of businesses
+
+    Each record is routed by its keys:
+    - "id": update that existing business
+    - "external_id" (and no id): insert, or update the business with that external id
+      (fields the record leaves out keep their current values)
+    - neither: insert a new business
+
+    Foreign keys are checked against the reference cache (with one IN query per relation
+    for ids it doesn't know) and all writes happen in a single transaction. Returns one result per record, in input order, like
+    {"index": 0, "status": "created", "id": 12} or {"index": 1, "status": "error", "errors": {...}}.
+    """
+    results = [None] * len(records)
+    valid = {}
+
+    # Validate each record's fields (no database queries happen here)
+    for index, record in enumerate(records):
+        serializer = BusinessBulkItemSerializer(data=record)
+        if serializer.is_valid():
+            valid[index] = serializer.validated_data
+        else:
+            results[index] = {"index": index, "status": "error", "errors": serializer.errors}
+
+    # Check every referenced category and service area against the reference cache
+    category_ids = {data["category_id"] for data in valid.values()}
+    area_ids = {data["service_area_id"] for data in valid.values() if data.get("service_area_id")}
+    known_categories = reference_cache.existing_category_ids(category_ids)
+    known_areas = reference_cache.existing_service_area_ids(area_ids)
+
+    # Check every referenced external id and business id with one query each
+    external_ids = {
+        data["external_id"] for data in valid.values()
+        if "id" not in data and data.get("external_id")
+    }
+    ids_by_existing_external_id = dict(
+        Business.objects.filter(external_id__in=external_ids).values_list("external_id", "id")
+    )
+    update_ids = {data["id"] for data in valid.values() if "id" in data}
+    # A partitioned table's unique index on external_id also includes the region, so
+    # ON CONFLICT (external_id) isn't available; existing external ids update by id instead
+    upsert_by_id = partitioning_enabled()
+    if upsert_by_id:
+        update_ids |= set(ids_by_existing_external_id.values())
+    existing = Business.objects.in_bulk(update_ids)
+
+    # Route each valid record to insert, update or upsert
+    to_create, to_update, to_upsert = [], [], []
+    seen_external_ids = set()
+    for index, data in valid.items():
+        errors = {}
+        if data["category_id"] not in known_categories:
+            errors["category_id"] = [f"Invalid pk \"{data['category_id']}\" - object does not exist."]
+        if data.get("service_area_id") and data["service_area_id"] not in known_areas:
+            errors["service_area_id"] = [f"Invalid pk \"{data['service_area_id']}\" - object does not exist."]
+        if "id" in data and data["id"] not in existing:
+            errors["id"] = [f"Invalid pk \"{data['id']}\" - object does not exist."]
+        external_id = data.get("external_id")
+        if external_id and external_id in seen_external_ids:
+            # A single upsert statement can't touch the same row twice
+            errors["external_id"] = ["Duplicate external_id in this batch."]
+        if errors:
+            results[index] = {"index": index, "status": "error", "errors": errors}
+            continue
+        if external_id:
+            seen_external_ids.add(external_id)
+
+        if "id" in data:
+            to_update.append((index, _build_business(data, existing[data["id"]])))
+        elif upsert_by_id and external_id in ids_by_existing_external_id:
+            to_update.append((index, _build_business(data, existing[ids_by_existing_external_id[external_id]])))
+        elif external_id and not upsert_by_id:
+            to_upsert.append((index, _build_business(data), _upsert_fields(data)))
+        else:
+            to_create.append((index, _build_business(data)))
+
+    with transaction.atomic():
+        # Plain inserts: PostgreSQL returns the new primary keys
+        if to_create:
+            Business.objects.bulk_create([business for _, business in to_create])
+            for index, business in to_create:
+                results[index] = {"index": index, "status": "created", "id": business.pk}
+
+        # Updates by primary key
+        if to_update:
+            Business.objects.bulk_update(
+                [business for _, business in to_update],
+                BULK_WRITE_FIELDS + ["external_id"],
+            )
+            for index, business in to_update:
+                results[index] = {"index": index, "status": "updated", "id": business.pk}
+
+        # Upserts on external id (INSERT ... ON CONFLICT (external_id) DO UPDATE), one
+        # statement per set of fields present so omitted fields aren't overwritten
+        if to_upsert:
+            by_fields = {}
+            for _, business, fields in to_upsert:
+                by_fields.setdefault(fields, []).append(business)
+            for fields, businesses in by_fields.items():
+                Business.objects.bulk_create(
+                    businesses,
+                    update_conflicts=True,
+                    unique_fields=["external_id"],
+                    update_fields=list(fields),
+                )
+            # Conflicting rows don't report their primary keys, so look them all up at once
+            ids_by_external_id = dict(
+                Business.objects.filter(
+                    external_id__in=[business.external_id for _, business, _ in to_upsert]
+                ).values_list("external_id", "id")
+            )
+            for index, business, _ in to_upsert:
+                results[index] = {
+                    "index": index,
+                    "status": "updated" if business.external_id in ids_by_existing_external_id else "created",
+                    "id": ids_by_external_id[business.external_id],
+                }
+
+        # Bulk writes skip signals; queue one job to re-derive the batch's service areas
+        written_ids = [result["id"] for result in results if result["status"] != "error"]
+        if written_ids:
+            enqueue("assign_business_service_area", {"business_ids": written_ids})
+
+    return results
@@ -0,0 +1,152 @@
+# Import csv/json writers for the text export formats
+import csv
+import io
+import json
+
+# Import Django's JSON encoder so timestamps match the API's ISO 8601 format
+from django.core.serializers.json import DjangoJSONEncoder
+# Import database helpers for building column expressions and running COPY
+from django.db import connection
+from django.db.models import F, FloatField, Func
+
+# Import our models
+from .models import Business
+# Import region filter for partition pruning
+from .partitioning import region_filter
+
+
+# Columns written by every export format, in output order
+EXPORT_COLUMNS = [
+    "id",
+    "external_id",
+    "name",
+    "description",
+    "phone",
+    "email",
+    "website",
+    "category",
+    "service_area",
+    "lon",
+    "lat",
+    "created_at",
+    "updated_at",
+]
+
+# Export formats that can be streamed row by row (FlatGeobuf needs its spatial index up front)
+STREAMING_FORMATS = ["csv", "ndjson"]
+
+# Number of rows fetched from the server-side cursor at a time
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def export_queryset(bbox=None, category=None, service_area=None):
+    """
+    Build the queryset of export rows with optional filters
+
+    Rows are flat tuples in EXPORT_COLUMNS order. Coordinates are pulled out with ST_X/ST_Y
+    in the database, so no geometry is parsed in Python. Filters match the list endpoint:
+    bbox is a Polygon, category a slug and service_area a name.
+    """
+    queryset = Business.objects.all()
+    if bbox is not None:
+        queryset = queryset.filter(region_filter(*bbox.extent), location__within=bbox)
+    if category:
+        queryset = queryset.filter(category__slug=category)
+    if service_area:
+        queryset = queryset.filter(service_area__name=service_area)
+
+    return queryset.annotate(
+        lon=Func(F("location"), function="ST_X", output_field=FloatField()),
+        lat=Func(F("location"), function="ST_Y", output_field=FloatField()),
+        category_slug=F("category__slug"),
+        service_area_name=F("service_area__name"),
+    ).order_by("id").values_list(
+        "id",
+        "external_id",
+        "name",
+        "description",
+        "phone",
+        "email",
+        "website",
+        "category_slug",
+        "service_area_name",
+        "lon",
+        "lat",
+        "created_at",
+        "updated_at",
+    )
+
+
+def iter_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterate over export rows without loading them all into memory
+
+    iterator() uses a server-side cursor on PostgreSQL, so memory stays constant.
+    """
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def iter_csv(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield export rows as CSV text, one chunk of rows at a time
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        # Flush the buffer every chunk rather than every row to keep overhead low
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield export rows as newline-delimited GeoJSON features, one chunk of rows at a time
+    """
+    lines = []
+    for row in rows:
+        properties = dict(zip(EXPORT_COLUMNS, row))
+        lon = properties.pop("lon")
+        lat = properties.pop("lat")
+        feature = {
+            "type": "Feature",
+            "id": properties["id"],
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": properties,
+        }
+        lines.append(json.dumps(feature, cls=DjangoJSONEncoder))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def queryset_sql(queryset):
+    """
+    Render a queryset as a single SQL string with its parameters bound
+
+    Used to hand the export query to COPY and ogr2ogr, which don't take parameters.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        return cursor.mogrify(sql, params).decode()
+
+
+def copy_csv(queryset, output):
+    """
+    Write the export as CSV with PostgreSQL's COPY ... TO STDOUT
+
+    The fastest path: rows go straight from the server into the output file.
+    Returns the number of rows written.
+    """
+    # Name the columns in the header the same way iter_csv does
+    columns = ", ".join(f'"{column}"' for column in EXPORT_COLUMNS)
+    sql = f"COPY (SELECT * FROM ({queryset_sql(queryset)}) AS export ({columns})) TO STDOUT WITH CSV HEADER"
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, output)
+        return cursor.rowcount
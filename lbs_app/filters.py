@@ -0,0 +1,36 @@
+# Import django-filter for query parameter filtering
+import django_filters
+
+# Import our models
+from .models import Business
+# Import the reference cache to turn slugs and names into ids
+from .reference_cache import reference_cache
+
+
+class BusinessFilterSet(django_filters.FilterSet):
+    """
+    Filters for the business list
+
+    Accepts the same parameters as before (category__slug, service_area__name) but resolves
+    them to ids through the reference cache, so the business query filters on the indexed
+    category_id/service_area_id columns instead of joining the lookup tables.
+    """
+    category__slug = django_filters.CharFilter(method="filter_category_slug")
+    service_area__name = django_filters.CharFilter(method="filter_service_area_name")
+
+    class Meta:
+        model = Business
+        fields = ["category__slug", "service_area__name"]
+
+    def filter_category_slug(self, queryset, name, value):
+        category = reference_cache.category_by_slug(value)
+        if category is None:
+            # Unknown slug: nothing can match
+            return queryset.none()
+        return queryset.filter(category_id=category.pk)
+
+    def filter_service_area_name(self, queryset, name, value):
+        area = reference_cache.service_area_by_name(value)
+        if area is None:
+            return queryset.none()
+        return queryset.filter(service_area_id=area.pk)
@@ -0,0 +1,97 @@
+# Import math helpers for snapping coordinates to grid cells
+import math
+
+# Import Polygon geometry type for bounding boxes
+from django.contrib.gis.geos import Polygon
+
+
+# Grid resolutions used for density aggregation (resolution level -> cell size in degrees)
+# 1.0° ≈ 111km (country scale), 0.1° ≈ 11km (city scale), 0.01° ≈ 1.1km (neighbourhood scale)
+GRID_RESOLUTIONS = {
+    1: 1.0,
+    2: 0.1,
+    3: 0.01,
+}
+
+# Largest number of cells a bounding box may span at the requested resolution
+# (e.g. a 10°x10° box at 0.1° cells); bigger requests must use a coarser resolution
+MAX_GRID_CELLS = 10000
+
+
+def grid_field_name(resolution):
+    """
+    Return the Business column that stores the cell id for a grid resolution
+
+    Example: resolution 2 -> "grid_cell_2"
+    """
+    return f"grid_cell_{resolution}"
+
+
+# Business columns holding the precomputed cell ids, one per resolution
+GRID_FIELDS = [grid_field_name(resolution) for resolution in GRID_RESOLUTIONS]
+
+
+def cell_id(lon, lat, resolution):
+    """
+    Compute the cell id containing a coordinate at the given resolution
+
+    Cell ids are "column:row" strings where column/row are the lon/lat snapped
+    down to multiples of the cell size, e.g. "-63:533" for Dublin at resolution 2.
+    """
+    size = GRID_RESOLUTIONS[resolution]
+    # Round before flooring so values like 53.3 / 0.1 don't fall into the cell below
+    column = math.floor(round(lon / size, 9))
+    row = math.floor(round(lat / size, 9))
+    return f"{column}:{row}"
+
+
+def cell_ids(lon, lat):
+    """
+    Compute the cell ids for a coordinate at every configured resolution
+
+    Returns a dictionary of Business field name -> cell id, ready to set on a model.
+    """
+    return {
+        grid_field_name(resolution): cell_id(lon, lat, resolution)
+        for resolution in GRID_RESOLUTIONS
+    }
+
+
+def cell_count(min_lon, min_lat, max_lon, max_lat, resolution):
+    """
+    Return how many cells a bounding box touches at the given resolution
+    """
+    size = GRID_RESOLUTIONS[resolution]
+    columns = math.floor(round(max_lon / size, 9)) - math.floor(round(min_lon / size, 9)) + 1
+    rows = math.floor(round(max_lat / size, 9)) - math.floor(round(min_lat / size, 9)) + 1
+    return columns * rows
+
+
+def cell_bounds(cell, resolution):
+    """
+    Return the bounding box of a cell as [min_lon, min_lat, max_lon, max_lat]
+    """
+    size = GRID_RESOLUTIONS[resolution]
+    column, row = (int(part) for part in cell.split(":"))
+    return [
+        round(column * size, 6),
+        round(row * size, 6),
+        round((column + 1) * size, 6),
+        round((row + 1) * size, 6),
+    ]
+
+
+def parse_bbox(value):
+    """
+    Parse a "min_lon,min_lat,max_lon,max_lat" string into a PostGIS Polygon
+
+    Returns None if the value is missing, malformed or has its corners the wrong way round.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except (AttributeError, TypeError, ValueError):
+        # Missing, wrong number of values or not numeric
+        return None
+    if min_lon >= max_lon or min_lat >= max_lat:
+        return None
+    return Polygon.from_bbox((min_lon, min_lat, max_lon, max_lat))
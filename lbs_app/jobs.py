@@ -0,0 +1,288 @@
+# Import helpers for worker ids, retry jitter and failure tracebacks
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+# Import database helpers for claiming jobs and batched updates
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, Max, Min, OuterRef, Subquery
+from django.utils import timezone
+
+# Import our models
+from .models import Business, Job, ServiceArea
+# Import region helpers for partition pruning
+from .partitioning import region_filter
+
+
+# Delay before the first retry; it doubles with every further attempt, up to the maximum
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 3600
+
+# Businesses checked per statement when assigning service areas
+ASSIGNMENT_BATCH_SIZE = 10000
+
+# Job kind -> handler(payload, progress)
+JOB_HANDLERS = {}
+
+
+class JobLost(Exception):
+    """
+    Raised when a job was retried elsewhere (its worker was presumed dead) while still running
+    """
+
+
+def job_handler(kind):
+    """
+    Register a function as the handler for a job kind
+
+    Handlers are called as handler(payload, progress) where progress(fraction, message="")
+    records how far the job has got. Raising an exception fails the attempt. Long
+    handlers should report progress at least once per batch: it is the heartbeat that
+    stops the job being presumed abandoned (see requeue_stale_jobs).
+    """
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, dedup_key=None, delay=0, max_attempts=5):
+    """
+    Queue a job and return it
+
+    If a pending job with the same dedup_key already exists, that job is returned instead
+    of queueing another. Inside a transaction the job only becomes visible to workers
+    when the transaction commits, so it never runs against uncommitted data.
+    """
+    while True:
+        if dedup_key:
+            existing = Job.objects.filter(dedup_key=dedup_key, status=Job.PENDING).first()
+            if existing:
+                return existing
+        try:
+            with transaction.atomic():
+                return Job.objects.create(
+                    kind=kind,
+                    payload=payload or {},
+                    dedup_key=dedup_key,
+                    max_attempts=max_attempts,
+                    run_after=timezone.now() + timedelta(seconds=delay),
+                )
+        except IntegrityError:
+            # Another process queued the same job between our check and insert; use theirs
+            continue
+
+
+def worker_id():
+    """
+    Return an identifier for this worker process
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def retry_delay(attempts):
+    """
+    Return how long to wait before retrying a job that has failed this many times
+    """
+    seconds = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    # Jitter so jobs that failed together (e.g. database restart) don't retry together
+    return timedelta(seconds=seconds * random.uniform(1, 1.25))
+
+
+def claim_job(worker):
+    """
+    Mark the next due job as running and return it, or None if nothing is due
+
+    SKIP LOCKED lets many workers claim jobs at once without waiting on each other.
+    """
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.PENDING, run_after__lte=timezone.now())
+            .order_by("run_after", "id")
+            .first()
+        )
+        if job is None:
+            return None
+        now = timezone.now()
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.worker = worker
+        job.started_at = now
+        job.heartbeat_at = now
+        job.finished_at = None
+        job.progress = 0
+        job.progress_message = ""
+        job.save(update_fields=[
+            "status", "attempts", "worker", "started_at", "heartbeat_at",
+            "finished_at", "progress", "progress_message",
+        ])
+    return job
+
+
+def _claimed(job):
+    """
+    Return a queryset matching the job only while this attempt of it is still running
+
+    Filtering on the worker and attempt number as well as the status keeps a worker that
+    was presumed dead from recording progress or an outcome over a later attempt.
+    """
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker, attempts=job.attempts)
+
+
+def report_progress(job, fraction, message=""):
+    """
+    Record a running job's progress (also serves as its heartbeat)
+
+    Raises JobLost if the job has since been taken from this worker, so the handler stops.
+    """
+    updated = _claimed(job).update(
+        progress=max(0.0, min(1.0, fraction)),
+        progress_message=message[:200],
+        heartbeat_at=timezone.now(),
+    )
+    if not updated:
+        raise JobLost(f"Job #{job.pk} attempt {job.attempts} is no longer running on {job.worker}")
+
+
+def fail_job(job, error, heartbeat_before=None):
+    """
+    Record a failed attempt: retry later with backoff, or give up after max_attempts
+
+    With heartbeat_before, only fail the job if it hasn't reported since then.
+    """
+    now = timezone.now()
+    running = _claimed(job)
+    if heartbeat_before is not None:
+        running = running.filter(heartbeat_at__lt=heartbeat_before)
+    if job.attempts < job.max_attempts:
+        try:
+            with transaction.atomic():
+                running.update(status=Job.PENDING, run_after=now + retry_delay(job.attempts), last_error=error)
+            return
+        except IntegrityError:
+            # Only one job per dedup key may be pending; the newer one redoes this work
+            error += "\nNot retried: a newer job with the same dedup key is already pending."
+    running.update(status=Job.FAILED, finished_at=now, last_error=error)
+
+
+def run_job(job):
+    """
+    Run a claimed job's handler and record the outcome; returns True if it succeeded
+    """
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind "{job.kind}"')
+        handler(job.payload, lambda fraction, message="": report_progress(job, fraction, message))
+    except JobLost:
+        # Another attempt owns the job now; leave recording its outcome to that one
+        return False
+    except Exception:
+        fail_job(job, traceback.format_exc())
+        return False
+    return bool(_claimed(job).update(
+        status=Job.SUCCEEDED, progress=1, finished_at=timezone.now(), last_error=""
+    ))
+
+
+def requeue_stale_jobs(stale_after):
+    """
+    Fail (and so retry) running jobs whose worker hasn't reported for stale_after seconds
+
+    Covers workers that were killed or lost their database connection mid-job.
+    Returns the number of jobs found.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = list(Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff))
+    for job in stale:
+        # Skip jobs that reported since they were read
+        fail_job(job, f"Worker {job.worker} stopped reporting before the job finished.", heartbeat_before=cutoff)
+    return len(stale)
+
+
+def _id_batches(queryset):
+    """
+    Split a Business queryset into id ranges of ASSIGNMENT_BATCH_SIZE
+
+    Yields (batch queryset, fraction of the id range done after it, last id in it), so
+    each UPDATE holds its row locks only briefly and progress can be reported per batch.
+    """
+    bounds = Business.objects.aggregate(first=Min("id"), last=Max("id"))
+    if bounds["first"] is None:
+        return
+    first, last = bounds["first"], bounds["last"]
+    for start in range(first, last + 1, ASSIGNMENT_BATCH_SIZE):
+        end = min(start + ASSIGNMENT_BATCH_SIZE, last + 1)
+        yield queryset.filter(id__gte=start, id__lt=end), (end - first) / (last - first + 1), end - 1
+
+
+def _containing_areas():
+    """
+    Service areas containing each business's location (for use in a subquery), by name
+    """
+    return ServiceArea.objects.filter(boundary__contains=OuterRef("location")).order_by("name")
+
+
+@job_handler("recompute_service_area")
+def recompute_service_area(payload, progress):
+    """
+    Assign unassigned businesses inside a service area's boundary to it
+
+    Businesses that already have a service area keep it, even if the new boundary no
+    longer contains them: the assignment may have been chosen by hand, and only unset
+    ones are ever filled in automatically. The table is worked through in id ranges.
+    """
+    area = ServiceArea.objects.filter(pk=payload["service_area_id"]).first()
+    if area is None:
+        # Deleted since the job was queued; SET_NULL has already unassigned its businesses
+        return
+    inside = region_filter(*area.boundary.extent)
+    unassigned = Business.objects.filter(inside, service_area__isnull=True, location__within=area.boundary)
+    for batch, fraction, last_id in _id_batches(unassigned):
+        # updated_at is set explicitly (update() skips auto_now) so the change feed sees the change
+        batch.update(service_area=area, updated_at=timezone.now())
+        progress(fraction, f"Checked businesses up to id {last_id}")
+
+
+# Business foreign keys whose targets are embedded in API responses (see touch_businesses)
+TOUCH_RELATIONS = {"category", "service_area"}
+
+
+@job_handler("touch_businesses")
+def touch_businesses(payload, progress):
+    """
+    Put every business of a changed category or service area back in the change feed
+
+    Businesses embed their category and service area in API responses, so clients caching
+    them need to see the new values. Queued when a field they embed changes.
+    """
+    relation = payload["relation"]
+    if relation not in TOUCH_RELATIONS:
+        raise ValueError(f'Cannot touch businesses by "{relation}"')
+    related = Business.objects.filter(**{f"{relation}_id": payload["pk"]})
+    for batch, fraction, last_id in _id_batches(related):
+        batch.update(updated_at=timezone.now())
+        progress(fraction, f"Checked businesses up to id {last_id}")
+
+
+@job_handler("assign_business_service_area")
+def assign_business_service_area(payload, progress):
+    """
+    Fill in the service area of businesses that were created or moved without one
+
+    Each unassigned business gets the first area (by name) containing its location, if
+    any. Businesses that have a service area keep it, so an explicit choice is never
+    overwritten.
+    """
+    business_ids = sorted(payload["business_ids"])
+    areas = _containing_areas()
+    for start in range(0, len(business_ids), ASSIGNMENT_BATCH_SIZE):
+        batch = business_ids[start:start + ASSIGNMENT_BATCH_SIZE]
+        Business.objects.filter(Exists(areas), pk__in=batch, service_area__isnull=True).update(
+            service_area=Subquery(areas.values("pk")[:1]), updated_at=timezone.now()
+        )
+        done = start + len(batch)
+        progress(done / len(business_ids), f"Checked {done} of {len(business_ids)} businesses")
@@ -0,0 +1,335 @@
+# Import standard library helpers for HTTP, threading, timing and statistics
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit
+# Import base command class for Django management commands
+from django.core.management.base import BaseCommand, CommandError
+# Import database connection for sampling query points
+from django.db import connection
+# Import our models
+from lbs_app.models import ServiceArea
+
+
+# Default request mix, mirroring what static/js/map.js and api.js send:
+# page loads (change feed sync), name searches, the search form (nearby + nearest 10)
+# and service area lookups
+DEFAULT_MIX = "changes=5,search=20,nearest=35,nearby=30,within_area=10"
+
+# Latency percentiles reported for every request type
+PERCENTILES = [50, 90, 95, 99]
+
+
+def percentile(sorted_values, pct):
+    """
+    Return the nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Command(BaseCommand):
+    """
+    Django management command to generate load against a running deployment
+
+    Replays the map UI's request mix against --base-url, with query points drawn from the
+    dataset's own spatial distribution. Closed-loop mode runs --concurrency virtual users
+    back to back; open-loop mode sends Poisson arrivals at --rate regardless of how fast
+    the server answers. Reports latency percentiles and errors per request type and can
+    save them as JSON to compare deployments.
+    Usage:
+        python manage.py load_test --base-url http://localhost --duration 60 --concurrency 20
+        python manage.py load_test --mode open --rate 100 --output after.json --compare before.json
+    """
+    help = 'Replay map UI traffic against a deployment and report latency percentiles'
+
+    def add_arguments(self, parser):
+        # Target and run length
+        parser.add_argument('--base-url', default='http://localhost:8000', help='Deployment to test')
+        parser.add_argument('--host-header', default='localhost',
+                            help='Host header to send (must be in the deployment\'s ALLOWED_HOSTS)')
+        parser.add_argument('--duration', type=float, default=60, help='Test length in seconds')
+        # Arrival model
+        parser.add_argument('--mode', choices=['closed', 'open'], default='closed',
+                            help='closed: users wait for each response; open: fixed arrival rate')
+        parser.add_argument('--concurrency', type=int, default=10, help='Virtual users (closed) or max in-flight requests (open)')
+        parser.add_argument('--rate', type=float, default=50, help='Requests per second in open mode')
+        parser.add_argument('--think-time', type=float, default=0, help='Seconds each closed-loop user waits between requests')
+        # Request mix and parameters
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Weighted request mix, e.g. "nearby=50,nearest=50"')
+        parser.add_argument('--radii', default='500,1000,2000,5000,10000', help='nearby radii in meters to pick from')
+        parser.add_argument('--sample-size', type=int, default=1000, help='Business locations sampled as query points')
+        parser.add_argument('--timeout', type=float, default=10, help='Per-request timeout in seconds')
+        parser.add_argument('--seed', type=int, help='Random seed for repeatable samples and request sequences')
+        # Results
+        parser.add_argument('--output', help='Save results as JSON to this file')
+        parser.add_argument('--compare', help='Previously saved results to compare against')
+
+    def handle(self, *args, **options):
+        self.options = options
+        # Used only by the main thread; closed-loop users each get their own (see user_rng)
+        self.rng = random.Random(options['seed'])
+        self.mix = self.parse_mix(options['mix'])
+        self.radii = [int(radius) for radius in options['radii'].split(',')]
+        target = urlsplit(options['base_url'])
+        if target.scheme not in ('http', 'https') or not target.hostname:
+            raise CommandError('--base-url must be an http(s) URL')
+        self.target = target
+
+        # Draw query inputs from the dataset so requests hit realistic areas
+        self.points = self.sample_points(options['sample_size'])
+        self.terms = self.sample_search_terms(options['sample_size'])
+        self.areas = list(ServiceArea.objects.order_by('name').values_list('name', flat=True)[:100])
+        if not self.points:
+            raise CommandError('No businesses to draw query points from; load some data first')
+        if not self.areas:
+            self.mix.pop('within_area', None)
+
+        self.samples = []
+        self.local = threading.local()
+        self.stdout.write(
+            f"Running {options['mode']}-loop load against {options['base_url']} for {options['duration']}s..."
+        )
+        started = time.monotonic()
+        if options['mode'] == 'closed':
+            self.run_closed()
+        else:
+            self.run_open()
+        elapsed = time.monotonic() - started
+
+        results = self.summarise(elapsed)
+        self.report(results)
+        if options['compare']:
+            self.compare(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
+
+    def parse_mix(self, value):
+        """
+        Parse "kind=weight,kind=weight" into a dictionary of weights
+        """
+        mix = {}
+        for part in value.split(','):
+            kind, _, weight = part.partition('=')
+            if kind not in ('changes', 'list', 'search', 'nearest', 'nearby', 'within_area'):
+                raise CommandError(f'Unknown request type "{kind}" in --mix')
+            try:
+                mix[kind] = float(weight)
+            except ValueError:
+                raise CommandError(f'Invalid weight for "{kind}" in --mix')
+        return mix
+
+    def sample_rows(self, columns, size):
+        """
+        Sample up to size business rows without scanning the whole table in order
+
+        With --seed, REPEATABLE makes PostgreSQL pick the same rows on every run (as long
+        as the table hasn't changed).
+        """
+        with connection.cursor() as cursor:
+            # A partitioned table's own reltuples is never set; add up its partitions'
+            cursor.execute(
+                "SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0) FROM pg_class c "
+                "WHERE c.oid = 'lbs_app_business'::regclass "
+                "OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'lbs_app_business'::regclass)"
+            )
+            estimate = cursor.fetchone()[0]
+            # BERNOULLI reads every page but skips sorting; ask for twice the rows to be safe
+            percent = 100.0 if estimate <= size else min(100.0, size * 200.0 / estimate)
+            repeatable, params = '', [percent]
+            if self.options['seed'] is not None:
+                repeatable = ' REPEATABLE (%s)'
+                params.append(self.options['seed'])
+            cursor.execute(
+                f"SELECT {columns} FROM lbs_app_business TABLESAMPLE BERNOULLI (%s){repeatable} LIMIT %s",
+                params + [size],
+            )
+            return cursor.fetchall()
+
+    def sample_points(self, size):
+        """
+        Sample business locations (lon, lat) as query points
+        """
+        return self.sample_rows('ST_X(location), ST_Y(location)', size)
+
+    def sample_search_terms(self, size):
+        """
+        Collect search terms from the first word of sampled business names, like users typing a name
+        """
+        names = [name for (name,) in self.sample_rows('name', size)]
+        return sorted({name.split()[0] for name in names if name.split()}) or ['Cafe']
+
+    def user_rng(self, index):
+        """
+        Return the random generator for closed-loop user number index
+
+        Each user thread draws from its own generator, derived from --seed, so every user
+        sends the same sequence on every run however the threads are scheduled.
+        """
+        if self.options['seed'] is None:
+            return random.Random()
+        return random.Random(f"{self.options['seed']}:{index}")
+
+    def next_request(self, rng):
+        """
+        Pick the next request type and build its URL, drawing from the given random generator
+        """
+        kind = rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        lon, lat = rng.choice(self.points)
+        # Users click near businesses rather than exactly on them (~1km jitter)
+        lon += rng.uniform(-0.01, 0.01)
+        lat += rng.uniform(-0.01, 0.01)
+        if kind == 'changes':
+            path, params = '/api/businesses/changes/', {'limit': 1000}
+        elif kind == 'list':
+            path, params = '/api/businesses/', {}
+        elif kind == 'search':
+            path, params = '/api/businesses/', {'search': rng.choice(self.terms)}
+        elif kind == 'nearest':
+            path, params = '/api/businesses/nearest/', {'lat': f'{lat:.6f}', 'lon': f'{lon:.6f}', 'limit': 10}
+        elif kind == 'nearby':
+            path, params = '/api/businesses/nearby/', {
+                'lat': f'{lat:.6f}', 'lon': f'{lon:.6f}', 'radius': rng.choice(self.radii)
+            }
+        else:
+            path, params = '/api/businesses/within-area/', {'name': rng.choice(self.areas)}
+        query = f'?{urlencode(params)}' if params else ''
+        return kind, f'{self.target.path.rstrip("/")}{path}{query}'
+
+    def http_connection(self):
+        """
+        Return this thread's keep-alive connection, like a browser reusing its socket
+        """
+        if getattr(self.local, 'connection', None) is None:
+            connection_class = http.client.HTTPSConnection if self.target.scheme == 'https' else http.client.HTTPConnection
+            self.local.connection = connection_class(self.target.hostname, self.target.port, timeout=self.options['timeout'])
+        return self.local.connection
+
+    def send(self, kind, url, scheduled=None):
+        """
+        Send one request and record its latency, status and type
+
+        In open-loop mode latency is measured from the scheduled send time, so time spent
+        waiting for a free worker counts (avoiding coordinated omission).
+        """
+        started = scheduled if scheduled is not None else time.monotonic()
+        status = None
+        try:
+            conn = self.http_connection()
+            # Send a Host Django accepts even when --base-url names a proxy (e.g. http://nginx)
+            conn.request('GET', url, headers={'Accept': 'application/json', 'Host': self.options['host_header']})
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection; the next request opens a new one
+            if self.local.connection is not None:
+                self.local.connection.close()
+            self.local.connection = None
+        self.samples.append((kind, (time.monotonic() - started) * 1000, status))
+
+    def run_closed(self):
+        """
+        Closed loop: each virtual user sends a request, waits for it, thinks, repeats
+        """
+        deadline = time.monotonic() + self.options['duration']
+
+        def user(index):
+            rng = self.user_rng(index)
+            while time.monotonic() < deadline:
+                self.send(*self.next_request(rng))
+                if self.options['think_time']:
+                    time.sleep(self.options['think_time'])
+
+        threads = [threading.Thread(target=user, args=(index,)) for index in range(self.options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open(self):
+        """
+        Open loop: requests arrive as a Poisson process at --rate, however slow the server is
+        """
+        deadline = time.monotonic() + self.options['duration']
+        with ThreadPoolExecutor(max_workers=self.options['concurrency']) as pool:
+            next_send = time.monotonic()
+            while next_send < deadline:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                kind, url = self.next_request(self.rng)
+                pool.submit(self.send, kind, url, next_send)
+                next_send += self.rng.expovariate(self.options['rate'])
+
+    def summarise(self, elapsed):
+        """
+        Turn the raw samples into per-type and overall statistics
+        """
+        by_kind = {}
+        for kind, latency, status in self.samples:
+            by_kind.setdefault(kind, []).append((latency, status))
+        by_kind['overall'] = [(latency, status) for _, latency, status in self.samples]
+
+        stats = {}
+        for kind, samples in by_kind.items():
+            latencies = sorted(latency for latency, _ in samples)
+            errors = sum(1 for _, status in samples if status is None or status >= 400)
+            stats[kind] = {
+                'requests': len(samples),
+                'errors': errors,
+                'error_rate': errors / len(samples) if samples else 0,
+                'throughput_rps': len(samples) / elapsed if elapsed else 0,
+                **{f'p{pct}_ms': percentile(latencies, pct) for pct in PERCENTILES},
+                'max_ms': latencies[-1] if latencies else None,
+            }
+        return {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'config': {
+                key: self.options[key]
+                for key in ('base_url', 'host_header', 'duration', 'mode', 'concurrency', 'rate', 'think_time', 'mix', 'radii', 'seed')
+            },
+            'elapsed_s': elapsed,
+            'stats': stats,
+        }
+
+    def report(self, results):
+        """
+        Print a latency table, one row per request type
+        """
+        header = f"{'type':<12}{'requests':>10}{'errors':>8}{'rps':>8}" + ''.join(f'{f"p{pct}":>9}' for pct in PERCENTILES) + f"{'max':>9}"
+        self.stdout.write(header)
+        for kind, stat in sorted(results['stats'].items(), key=lambda item: item[0] == 'overall'):
+            row = f"{kind:<12}{stat['requests']:>10}{stat['errors']:>8}{stat['throughput_rps']:>8.1f}"
+            for key in [f'p{pct}_ms' for pct in PERCENTILES] + ['max_ms']:
+                row += f'{stat[key]:>9.1f}' if stat[key] is not None else f"{'-':>9}"
+            self.stdout.write(row)
+
+    def compare(self, results, baseline_path):
+        """
+        Print how p50/p95/p99 latency and error rate changed against a saved run
+        """
+        try:
+            with open(baseline_path) as baseline_file:
+                baseline = json.load(baseline_file)['stats']
+        except (OSError, ValueError, KeyError):
+            raise CommandError(f'Could not read baseline results from {baseline_path}')
+        self.stdout.write(f'Compared with {baseline_path}:')
+        for kind, stat in results['stats'].items():
+            if kind not in baseline:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                before, after = baseline[kind].get(key), stat[key]
+                if before and after is not None:
+                    changes.append(f'{key[:-3]} {before:.1f}->{after:.1f}ms ({(after - before) / before:+.0%})')
+            changes.append(f"errors {baseline[kind]['error_rate']:.2%}->{stat['error_rate']:.2%}")
+            self.stdout.write(f'  {kind:<12}' + ', '.join(changes))
@@ -0,0 +1,282 @@
+# Import regular expressions for validating names and rewriting index definitions
+import re
+# Import base command class for Django management commands
+from django.core.management.base import BaseCommand, CommandError
+# Import database connection and transactions for the DDL
+from django.db import connection, transaction
+# Import region helpers
+from lbs_app.partitioning import GEOHASH_ALPHABET, REGION_PRECISION
+
+
+# Business table and the partition that catches regions without their own partition
+TABLE = "lbs_app_business"
+DEFAULT_PARTITION = f"{TABLE}_default"
+# Temporary name of the original table while its rows are copied
+OLD_TABLE = f"{TABLE}_unpartitioned"
+
+# A partitioned table's unique indexes must include the partition key, so external_id is
+# only unique per region there. This lookup table, kept in sync by a trigger, keeps it
+# unique across the whole table (a duplicate raises unique_violation -> IntegrityError).
+EXTERNAL_ID_TABLE = f"{TABLE}_external_ids"
+EXTERNAL_ID_FUNCTION = f"{TABLE}_sync_external_id"
+EXTERNAL_ID_SQL = f"""
+CREATE TABLE "{EXTERNAL_ID_TABLE}" (
+    external_id varchar(100) PRIMARY KEY,
+    business_id bigint NOT NULL
+);
+INSERT INTO "{EXTERNAL_ID_TABLE}" (external_id, business_id)
+    SELECT external_id, id FROM "{TABLE}" WHERE external_id IS NOT NULL;
+CREATE FUNCTION "{EXTERNAL_ID_FUNCTION}"() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        IF OLD.external_id IS NOT NULL THEN
+            DELETE FROM "{EXTERNAL_ID_TABLE}" WHERE external_id = OLD.external_id AND business_id = OLD.id;
+        END IF;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        IF NEW.external_id IS NOT NULL THEN
+            INSERT INTO "{EXTERNAL_ID_TABLE}" (external_id, business_id) VALUES (NEW.external_id, NEW.id)
+                ON CONFLICT (external_id) DO NOTHING;
+            -- Re-inserting a row's own mapping (rows moved between partitions) is fine
+            IF NOT FOUND AND NOT EXISTS (
+                SELECT 1 FROM "{EXTERNAL_ID_TABLE}" WHERE external_id = NEW.external_id AND business_id = NEW.id
+            ) THEN
+                RAISE unique_violation USING
+                    MESSAGE = format('duplicate external_id %L', NEW.external_id),
+                    CONSTRAINT = '{EXTERNAL_ID_TABLE}_pkey';
+            END IF;
+        END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER "{EXTERNAL_ID_FUNCTION}" AFTER INSERT OR UPDATE OF external_id, id OR DELETE
+    ON "{TABLE}" FOR EACH ROW EXECUTE FUNCTION "{EXTERNAL_ID_FUNCTION}"();
+"""
+
+
+class Command(BaseCommand):
+    """
+    Django management command to partition the Business table by region
+
+    The region column holds a 2-character geohash of each location. Converting the table
+    to PARTITION BY LIST (region) lets PostgreSQL vacuum, reindex and scan each part of
+    the world separately; set BUSINESS_PARTITIONING=True afterwards so spatial queries add
+    region predicates for partition pruning.
+    Usage:
+        python manage.py partition_businesses status
+        python manage.py partition_businesses convert
+        python manage.py partition_businesses add europe gb gc u0 u1 u2 u3
+        python manage.py partition_businesses split europe --into ireland_uk:gc,gb rest:u0,u1,u2,u3
+    """
+    help = 'Partition the Business table by geohash region, and add or split partitions'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+        # Show partitions and the busiest regions without their own partition
+        subparsers.add_parser('status', help='Show partitions and region row counts')
+        # One-off migration of the existing table
+        subparsers.add_parser('convert', help='Convert the Business table to a partitioned table')
+        # Give some regions their own partition (moving their rows out of the default)
+        add = subparsers.add_parser('add', help='Add a partition for some regions')
+        add.add_argument('name', help='Partition name (letters, digits and underscores)')
+        add.add_argument('regions', nargs='+', help='Region keys (geohash prefixes) for the partition')
+        # Replace one partition with several smaller ones
+        split = subparsers.add_parser('split', help='Split a partition into several partitions')
+        split.add_argument('name', help='Partition to split')
+        split.add_argument('--into', nargs='+', required=True, metavar='NAME:REGION,REGION',
+                           help='New partitions and their regions')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'status':
+            self.status()
+        elif options['action'] == 'convert':
+            self.convert()
+        elif options['action'] == 'add':
+            self.add(options['name'], options['regions'])
+        else:
+            self.split(options['name'], [self.parse_group(group) for group in options['into']])
+
+    def partition_table(self, name):
+        """
+        Validate a partition name and return its table name
+        """
+        if not re.fullmatch(r'[a-z0-9_]{1,40}', name) or name == 'default':
+            raise CommandError(f'Invalid partition name "{name}"')
+        return f'{TABLE}_p_{name}'
+
+    def validate_regions(self, regions):
+        """
+        Check region keys are geohash prefixes of the configured length
+        """
+        for region in regions:
+            if len(region) != REGION_PRECISION or any(char not in GEOHASH_ALPHABET for char in region):
+                raise CommandError(f'Invalid region "{region}" (expected {REGION_PRECISION} geohash characters)')
+        return regions
+
+    def parse_group(self, group):
+        """
+        Parse a NAME:REGION,REGION argument into (name, [regions])
+        """
+        name, _, regions = group.partition(':')
+        if not regions:
+            raise CommandError(f'Expected NAME:REGION,REGION but got "{group}"')
+        return name, self.validate_regions(regions.split(','))
+
+    def is_partitioned(self, cursor):
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+            [TABLE],
+        )
+        return cursor.fetchone()[0]
+
+    def require_partitioned(self, cursor):
+        if not self.is_partitioned(cursor):
+            raise CommandError(f'{TABLE} is not partitioned yet; run "partition_businesses convert" first')
+
+    def move_rows(self, cursor, source, regions=None):
+        """
+        Re-insert rows from a detached table through the parent so they land in the right partition
+        """
+        where = "WHERE region = ANY(%s)" if regions else ""
+        params = [list(regions)] if regions else []
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{source}" {where}', params)
+        moved = cursor.rowcount
+        if regions:
+            # The rows still exist (in their new partition); don't let triggers treat this as a delete
+            cursor.execute(f'ALTER TABLE "{source}" DISABLE TRIGGER USER')
+            cursor.execute(f'DELETE FROM "{source}" {where}', params)
+            cursor.execute(f'ALTER TABLE "{source}" ENABLE TRIGGER USER')
+        return moved
+
+    def status(self):
+        with connection.cursor() as cursor:
+            if not self.is_partitioned(cursor):
+                self.stdout.write(f'{TABLE} is not partitioned. Rows per region:')
+                source = TABLE
+            else:
+                cursor.execute(
+                    """
+                    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint
+                    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = %s::regclass ORDER BY c.relname
+                    """,
+                    [TABLE],
+                )
+                for name, bound, rows in cursor.fetchall():
+                    self.stdout.write(f'{name}: {bound} (~{max(rows, 0)} rows)')
+                self.stdout.write('Busiest regions still in the default partition:')
+                source = DEFAULT_PARTITION
+            cursor.execute(
+                f'SELECT region, count(*) FROM "{source}" GROUP BY region ORDER BY count(*) DESC LIMIT 20'
+            )
+            for region, rows in cursor.fetchall():
+                self.stdout.write(f'  {region or "(none)"}: {rows}')
+
+    def convert(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if self.is_partitioned(cursor):
+                raise CommandError(f'{TABLE} is already partitioned')
+
+            # Partitioned tables can't be the target of foreign keys on id alone
+            cursor.execute(
+                "SELECT conname FROM pg_constraint WHERE confrelid = %s::regclass AND contype = 'f'",
+                [TABLE],
+            )
+            references = [row[0] for row in cursor.fetchall()]
+            if references:
+                raise CommandError(f'Foreign keys reference {TABLE}: {", ".join(references)}')
+
+            # Remember the current indexes, foreign keys and how the id column gets its values
+            cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", [TABLE])
+            indexes = cursor.fetchall()
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [TABLE],
+            )
+            foreign_keys = cursor.fetchall()
+            cursor.execute(
+                "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+                [TABLE],
+            )
+            is_identity = bool(cursor.fetchone()[0])
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+            sequence = cursor.fetchone()[0]
+
+            # Create the partitioned table with the same columns and copy the rows into it
+            self.stdout.write(f'Copying {TABLE} into a partitioned table...')
+            cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"')
+            cursor.execute(
+                f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}" INCLUDING DEFAULTS INCLUDING IDENTITY '
+                f'INCLUDING CONSTRAINTS INCLUDING STORAGE) PARTITION BY LIST (region)'
+            )
+            cursor.execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+            if not is_identity:
+                # A serial id keeps using the old sequence, so it must outlive the old table
+                cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY "{TABLE}".id')
+            moved = self.move_rows(cursor, OLD_TABLE)
+            cursor.execute(f'DROP TABLE "{OLD_TABLE}"')
+            if is_identity:
+                # The copied identity column has a fresh sequence; continue after the highest id
+                cursor.execute(
+                    f'SELECT setval(pg_get_serial_sequence(%s, \'id\'), COALESCE(MAX(id), 0) + 1, false) FROM "{TABLE}"',
+                    [TABLE],
+                )
+
+            # Recreate the indexes on the parent (they cascade to every partition)
+            # Unique indexes on a partitioned table must include the partition key
+            self.stdout.write(f'Recreating {len(indexes)} indexes...')
+            for name, definition in indexes:
+                if name == f'{TABLE}_pkey':
+                    cursor.execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY (id, region)')
+                elif definition.startswith('CREATE UNIQUE INDEX'):
+                    cursor.execute(re.sub(r'\)$', ', region)', definition))
+                else:
+                    cursor.execute(definition)
+            # CREATE TABLE ... LIKE doesn't copy foreign keys
+            for name, definition in foreign_keys:
+                cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {definition}')
+
+            # Keep external_id unique across regions
+            cursor.execute(EXTERNAL_ID_SQL)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Partitioned {TABLE} ({moved} rows, all in {DEFAULT_PARTITION}). '
+            'Add partitions with "partition_businesses add" and set BUSINESS_PARTITIONING=True.'
+        ))
+
+    def add(self, name, regions):
+        table = self.partition_table(name)
+        self.validate_regions(regions)
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.require_partitioned(cursor)
+            # Detach the default partition so the new partition can claim its regions' rows
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{DEFAULT_PARTITION}"')
+            cursor.execute(
+                f'CREATE TABLE "{table}" PARTITION OF "{TABLE}" FOR VALUES IN ({", ".join(["%s"] * len(regions))})',
+                regions,
+            )
+            moved = self.move_rows(cursor, DEFAULT_PARTITION, regions)
+            cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT')
+        self.stdout.write(self.style.SUCCESS(f'Created {table} for {", ".join(regions)} ({moved} rows moved)'))
+
+    def split(self, name, groups):
+        table = self.partition_table(name)
+        new_tables = [(self.partition_table(new_name), regions) for new_name, regions in groups]
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.require_partitioned(cursor)
+            # Detach the partition and move it aside so its name can be reused
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{table}"')
+            cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_split"')
+            for new_table, regions in new_tables:
+                cursor.execute(
+                    f'CREATE TABLE "{new_table}" PARTITION OF "{TABLE}" FOR VALUES IN ({", ".join(["%s"] * len(regions))})',
+                    regions,
+                )
+            # Rows in regions no new partition covers land in the default partition
+            moved = self.move_rows(cursor, f'{table}_split')
+            cursor.execute(f'DROP TABLE "{table}_split"')
+        self.stdout.write(self.style.SUCCESS(
+            f'Split {table} into {", ".join(new_table for new_table, _ in new_tables)} ({moved} rows moved)'
+        ))
@@ -0,0 +1,150 @@
+# Import standard library helpers for processes, signals and timing
+import multiprocessing
+import os
+import signal
+import time
+# Import base command class for Django management commands
+from django.core.management.base import BaseCommand, CommandError
+# Import database connections so each worker process opens its own
+from django.db import connections
+# Import aggregation function for the --status summary
+from django.db.models import Count
+# Import the job queue and its model
+from lbs_app.jobs import claim_job, requeue_stale_jobs, run_job, worker_id
+from lbs_app.models import Job
+
+
+class Command(BaseCommand):
+    """
+    Django management command to run background jobs
+
+    Starts a pool of worker processes that claim due jobs from the job table (see
+    lbs_app/jobs.py), run them and record progress, retries and failures. Workers that die
+    are replaced; running jobs whose worker stops reporting are retried after --stale-after.
+    SIGINT/SIGTERM let every worker finish its current job before exiting.
+    Usage:
+        python manage.py run_workers --processes 4
+        python manage.py run_workers --burst        # run every due job, then exit
+        python manage.py run_workers --status       # show queue counts and running jobs
+    """
+    help = 'Run background jobs (service area recomputation etc.) in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when no job is due')
+        parser.add_argument('--stale-after', type=float, default=300,
+                            help='Seconds without progress after which a running job is retried')
+        parser.add_argument('--max-jobs', type=int, default=0,
+                            help='Replace each worker process after this many jobs (0: never)')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+        parser.add_argument('--status', action='store_true', help='Show queue counts and running jobs, then exit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.status()
+            return
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        self.options = options
+
+        # Fork so workers inherit the configured Django setup
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+
+        def request_stop(signum, frame):
+            if not stop.is_set():
+                self.stdout.write('Stopping after the current jobs finish...')
+            stop.set()
+
+        previous_handlers = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            if options['processes'] == 1:
+                # Run in this process (no fork needed)
+                self.work(stop)
+            else:
+                self.run_pool(context, stop)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def run_pool(self, context, stop):
+        """
+        Start the worker processes and replace any that exit until shutdown
+        """
+        # Children must not share the parent's database connections
+        connections.close_all()
+        processes = [self.start_worker(context, stop) for _ in range(self.options['processes'])]
+        self.stdout.write(f"Started {len(processes)} worker processes")
+        while processes:
+            for process in list(processes):
+                if process.is_alive():
+                    continue
+                process.join()
+                processes.remove(process)
+                if process.exitcode:
+                    self.stderr.write(f'Worker {process.pid} exited with code {process.exitcode}')
+                # Replace workers that crashed or were recycled, unless shutting down or draining
+                if not stop.is_set() and not self.options['burst']:
+                    processes.append(self.start_worker(context, stop))
+            time.sleep(0.5)
+
+    def start_worker(self, context, stop):
+        process = context.Process(target=self.worker_process, args=(stop,))
+        process.start()
+        return process
+
+    def worker_process(self, stop):
+        # Ctrl-C reaches the whole process group; let the parent coordinate the shutdown
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        try:
+            self.work(stop)
+        finally:
+            connections.close_all()
+
+    def work(self, stop):
+        """
+        Claim and run jobs until told to stop (or, with --burst, until none is due)
+        """
+        worker = worker_id()
+        processed = 0
+        last_stale_check = 0.0
+        while not stop.is_set():
+            # Check for abandoned jobs now and then, not on every claim
+            if time.monotonic() - last_stale_check > self.options['stale_after'] / 2:
+                requeued = requeue_stale_jobs(self.options['stale_after'])
+                if requeued:
+                    self.stdout.write(f'[{worker}] Found {requeued} abandoned jobs')
+                last_stale_check = time.monotonic()
+
+            job = claim_job(worker)
+            if job is None:
+                if self.options['burst']:
+                    break
+                stop.wait(self.options['poll_interval'])
+                continue
+
+            self.stdout.write(f'[{worker}] Running {job.kind} #{job.pk} (attempt {job.attempts}/{job.max_attempts})')
+            started = time.monotonic()
+            succeeded = run_job(job)
+            elapsed = time.monotonic() - started
+            if succeeded:
+                self.stdout.write(self.style.SUCCESS(f'[{worker}] Finished {job.kind} #{job.pk} in {elapsed:.1f}s'))
+            else:
+                self.stderr.write(f'[{worker}] {job.kind} #{job.pk} failed after {elapsed:.1f}s')
+
+            processed += 1
+            if self.options['max_jobs'] and processed >= self.options['max_jobs']:
+                break
+
+    def status(self):
+        """
+        Print job counts by kind and status, and the progress of running jobs
+        """
+        counts = Job.objects.values('kind', 'status').annotate(jobs=Count('id')).order_by('kind', 'status')
+        for row in counts:
+            self.stdout.write(f"{row['kind']:<32}{row['status']:<12}{row['jobs']:>8}")
+        for job in Job.objects.filter(status=Job.RUNNING).order_by('started_at'):
+            self.stdout.write(
+                f'{job.kind} #{job.pk} on {job.worker}: {job.progress:.0%} {job.progress_message}'
+            )
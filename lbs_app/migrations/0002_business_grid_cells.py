@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+# Backfill grid cells for existing rows using the same snapping rule as lbs_app/grid.py
+BACKFILL_SQL = """
+UPDATE lbs_app_business SET
+    grid_cell_1 = floor(round((ST_X(location) / 1.0)::numeric, 9))::bigint || ':' ||
+                  floor(round((ST_Y(location) / 1.0)::numeric, 9))::bigint,
+    grid_cell_2 = floor(round((ST_X(location) / 0.1)::numeric, 9))::bigint || ':' ||
+                  floor(round((ST_Y(location) / 0.1)::numeric, 9))::bigint,
+    grid_cell_3 = floor(round((ST_X(location) / 0.01)::numeric, 9))::bigint || ':' ||
+                  floor(round((ST_Y(location) / 0.01)::numeric, 9))::bigint;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lbs_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='grid_cell_1',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='business',
+            name='grid_cell_2',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='business',
+            name='grid_cell_3',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['grid_cell_1', 'category'], name='lbs_app_bus_grid_1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['grid_cell_2', 'category'], name='lbs_app_bus_grid_2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['grid_cell_3', 'category'], name='lbs_app_bus_grid_3_idx'),
+        ),
+    ]
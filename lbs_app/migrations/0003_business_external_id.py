@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lbs_app', '0002_business_grid_cells'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lbs_app', '0003_business_external_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['updated_at', 'id'], name='lbs_app_bus_updated_idx'),
+        ),
+        migrations.CreateModel(
+            name='BusinessTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('business_id', models.BigIntegerField()),
+                ('external_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['deleted_at', 'id'],
+                'indexes': [models.Index(fields=['deleted_at'], name='lbs_app_tomb_deleted_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+import django.contrib.postgres.indexes
+from django.db import migrations
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lbs_app', '0005_business_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='business',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('description'), name='gin_trgm_ops'), name='lbs_app_bus_desc_trgm_idx'),
+        ),
+    ]
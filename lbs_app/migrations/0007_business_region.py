@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lbs_app', '0006_business_description_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='region',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        # Backfill the region key with the same 2-character geohash the model computes
+        migrations.RunSQL(
+            "UPDATE lbs_app_business SET region = ST_GeoHash(location, 2);",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
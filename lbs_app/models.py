@@ -1,7 +1,18 @@
+# Import uuid for reference data version tokens
+import uuid
+
 # Import GeoDjango models for spatial database support
 from django.contrib.gis.db import models
+# Import PostgreSQL index types for trigram (substring) search
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 from django.utils import timezone
 
+# Import grid helpers used to precompute density aggregation cells
+from .grid import GRID_FIELDS, cell_ids
+# Import the geohash region key used for optional table partitioning
+from .partitioning import geohash
+
 
 class BusinessCategory(models.Model):
     """
@@ -43,6 +54,10 @@ class ServiceArea(models.Model):
     class Meta:
         # Order service areas alphabetically by name
         ordering = ["name"]
+        indexes = [
+            # Speed up case-insensitive name lookups (name__iexact -> UPPER(name) = UPPER(...))
+            models.Index(Upper("name"), name="lbs_app_ser_name_upper_idx"),
+        ]
 
     def __str__(self):
         # Display the service area name in admin interface
@@ -78,6 +93,8 @@ class Business(models.Model):
     email = models.EmailField(blank=True)
     # Business website URL
     website = models.URLField(blank=True)
+    # Identifier of this business in the upstream system (used for idempotent bulk upserts)
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
     # Point geometry for the business location (latitude/longitude using WGS84)
     # This is the key spatial field that enables location-based searches
     location = models.PointField(srid=4326)
@@ -85,6 +102,14 @@ class Business(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     # Timestamp when business record was last updated (auto-updated on save)
     updated_at = models.DateTimeField(auto_now=True)
+    # Precomputed grid cell ids at each aggregation resolution (see lbs_app/grid.py)
+    # Kept current on save so heatmap aggregation can GROUP BY without touching geometry
+    grid_cell_1 = models.CharField(max_length=32, blank=True, editable=False)
+    grid_cell_2 = models.CharField(max_length=32, blank=True, editable=False)
+    grid_cell_3 = models.CharField(max_length=32, blank=True, editable=False)
+    # Geohash prefix of the location (see lbs_app/partitioning.py), kept current on save
+    # Used as the partition key when the table is partitioned by region
+    region = models.CharField(max_length=12, blank=True, editable=False)
 
     class Meta:
         # Order businesses alphabetically by name
@@ -92,12 +117,205 @@ class Business(models.Model):
         # Database indexes to speed up queries on common fields
         indexes = [
             models.Index(fields=["name"]),           # Speed up name searches
+            # Speed up substring name searches (icontains -> UPPER(name) LIKE UPPER('%...%'))
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="lbs_app_bus_name_trgm_idx"),
+            # Speed up substring description searches in the API (search=...)
+            GinIndex(OpClass(Upper("description"), name="gin_trgm_ops"), name="lbs_app_bus_desc_trgm_idx"),
             models.Index(fields=["category"]),       # Speed up category filtering
             models.Index(fields=["service_area"]),   # Speed up service area filtering
             models.Index(fields=["-created_at"]),    # Speed up sorting by creation date (newest first)
+            # Speed up the change feed (WHERE updated_at > ? ORDER BY updated_at, id)
+            models.Index(fields=["updated_at", "id"], name="lbs_app_bus_updated_idx"),
+            # Speed up grid aggregation (GROUP BY cell, category)
+            models.Index(fields=["grid_cell_1", "category"], name="lbs_app_bus_grid_1_idx"),
+            models.Index(fields=["grid_cell_2", "category"], name="lbs_app_bus_grid_2_idx"),
+            models.Index(fields=["grid_cell_3", "category"], name="lbs_app_bus_grid_3_idx"),
         ]
         # Note: PostGIS automatically creates a GIST index on the location field for spatial queries
 
     def __str__(self):
         # Display the business name in admin interface
-        return self.name
\ No newline at end of file
+        return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep a reference to the loaded location (not a copy, so reads cost nothing extra)
+        # so saves can tell whether the business moved
+        instance.remember_location()
+        return instance
+
+    def remember_location(self):
+        """
+        Record the current location as the stored one (see location_changed)
+        """
+        self._stored_location = self.__dict__.get("location")
+
+    def location_changed(self):
+        """
+        Return True if the location differs from the one loaded from (or last saved to) the database
+
+        Instances that weren't loaded from the database count as changed. A location is
+        changed by assigning a new geometry (as forms and serializers do); editing the
+        loaded geometry in place isn't detected.
+        """
+        if not hasattr(self, "_stored_location"):
+            return True
+        stored = self._stored_location
+        return self.location is not stored and self.location != stored
+
+    def assign_grid_cells(self):
+        """
+        Recompute the precomputed grid cell ids from the current location
+        """
+        if self.location is not None:
+            for field_name, value in cell_ids(self.location.x, self.location.y).items():
+                setattr(self, field_name, value)
+
+    def assign_region(self):
+        """
+        Recompute the geohash region key from the current location
+        """
+        if self.location is not None:
+            self.region = geohash(self.location.x, self.location.y)
+
+    def save(self, *args, **kwargs):
+        # Grid cells and region are assigned by the pre_save signal (lbs_app/signals.py), which
+        # also covers fixture loading; make sure partial saves of the location write them too
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "location" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | set(GRID_FIELDS) | {"region"}
+        super().save(*args, **kwargs)
+
+
+class BusinessTombstone(models.Model):
+    """
+    Record of a deleted business for the change feed
+
+    When a business is deleted, a tombstone keeps its id so clients syncing with
+    /api/businesses/changes/ can drop it from their local cache.
+    """
+    # Primary key of the deleted business (not a foreign key - the row is gone)
+    business_id = models.BigIntegerField()
+    # Upstream identifier of the deleted business, if it had one
+    external_id = models.CharField(max_length=100, null=True, blank=True)
+    # Timestamp when the business was deleted
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # Order tombstones in the order the deletes happened
+        ordering = ["deleted_at", "id"]
+        indexes = [
+            # Speed up the change feed (WHERE deleted_at > ?)
+            models.Index(fields=["deleted_at"], name="lbs_app_tomb_deleted_idx"),
+        ]
+
+    def __str__(self):
+        return f"Deleted business {self.business_id}"
+
+
+class ReferenceDataVersion(models.Model):
+    """
+    Version token for categories and service areas, shared by all workers
+
+    A single row whose token changes whenever a category or service area is saved or
+    deleted. Each worker's reference cache (lbs_app/reference_cache.py) compares it with
+    the token it loaded to know when to reload.
+    """
+    # Random token (not a counter, so a rolled-back change can't reuse a cached token)
+    token = models.CharField(max_length=32)
+    # Timestamp of the last change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.token
+
+    @classmethod
+    def current(cls):
+        """
+        Return the current version token ("" if no change has been recorded yet)
+        """
+        return cls.objects.filter(pk=1).values_list("token", flat=True).first() or ""
+
+    @classmethod
+    def bump(cls):
+        """
+        Replace the version token so every worker reloads its reference cache
+        """
+        cls.objects.update_or_create(pk=1, defaults={"token": uuid.uuid4().hex})
+
+
+class Job(models.Model):
+    """
+    Background job for heavy work that shouldn't run inside a request
+
+    Jobs are rows in this table; `python manage.py run_workers` claims pending ones with
+    SELECT ... FOR UPDATE SKIP LOCKED and runs the handler registered for their kind
+    (see lbs_app/jobs.py). No separate message broker is needed.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    # Which handler runs the job, e.g. "recompute_service_area"
+    kind = models.CharField(max_length=50)
+    # Handler arguments
+    payload = models.JSONField(default=dict, blank=True)
+    # Jobs with the same key aren't queued twice (only one may be pending at a time)
+    dedup_key = models.CharField(max_length=200, null=True, blank=True)
+    # Where the job is in its lifecycle
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    # Number of times a worker has started the job, and how many tries it gets
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Earliest time a worker may run the job (pushed back after a failure)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Progress reported by the handler: fraction done (0-1) and a short message
+    progress = models.FloatField(default=0)
+    progress_message = models.CharField(max_length=200, blank=True)
+    # Traceback of the last failure
+    last_error = models.TextField(blank=True)
+    # Worker currently (or last) running the job, as "hostname:pid"
+    worker = models.CharField(max_length=100, blank=True)
+    # Lifecycle timestamps
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Last sign of life from the running worker (set on claim and on every progress report)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Show the newest jobs first
+        ordering = ["-id"]
+        indexes = [
+            # Speed up claiming the next job (WHERE status = 'pending' ORDER BY run_after, id)
+            models.Index(
+                fields=["run_after", "id"],
+                condition=models.Q(status="pending"),
+                name="lbs_app_job_pending_idx",
+            ),
+            # Speed up finding jobs whose worker died (WHERE status = 'running' AND heartbeat_at < ?)
+            models.Index(
+                fields=["heartbeat_at"],
+                condition=models.Q(status="running"),
+                name="lbs_app_job_running_idx",
+            ),
+        ]
+        constraints = [
+            # At most one pending job per dedup key
+            models.UniqueConstraint(
+                fields=["dedup_key"],
+                condition=models.Q(status="pending"),
+                name="lbs_app_job_pending_dedup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,106 @@
+# Import math helpers for snapping coordinates to region cells
+import math
+
+# Import settings to check whether the Business table is partitioned
+from django.conf import settings
+from django.db.models import Q
+
+
+# Geohash precision used as the Business region (partition) key
+# 2 characters = cells of 11.25° longitude x 5.625° latitude (32 x 32 cells worldwide)
+REGION_PRECISION = 2
+
+# Number of region cells along each axis at REGION_PRECISION (5 bits per axis)
+REGION_CELLS = 2 ** (REGION_PRECISION * 5 // 2)
+
+# Skip the region predicate when a query would touch more cells than this
+# (pruning buys nothing for continent-sized searches and the IN list gets long)
+MAX_PRUNING_REGIONS = 64
+
+# Geohash base-32 alphabet
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def partitioning_enabled():
+    """
+    Return True when the Business table has been converted to region partitions
+
+    Set BUSINESS_PARTITIONING=True after running `manage.py partition_businesses convert`.
+    """
+    return getattr(settings, "BUSINESS_PARTITIONING", False)
+
+
+def geohash(lon, lat, precision=REGION_PRECISION):
+    """
+    Encode a coordinate as a geohash string (same result as PostGIS ST_GeoHash)
+    """
+    lon_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        # Alternate between halving the longitude and latitude ranges
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        # Every 5 bits make one base-32 character
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def _region_for_cell(lon_index, lat_index):
+    # Interleave the longitude and latitude cell indexes into geohash bits (longitude first)
+    bits = 0
+    for bit in reversed(range(REGION_PRECISION * 5 // 2)):
+        bits = (bits << 1) | ((lon_index >> bit) & 1)
+        bits = (bits << 1) | ((lat_index >> bit) & 1)
+    return "".join(
+        GEOHASH_ALPHABET[(bits >> shift) & 31]
+        for shift in range((REGION_PRECISION - 1) * 5, -1, -5)
+    )
+
+
+def regions_for_bbox(min_lon, min_lat, max_lon, max_lat):
+    """
+    Return the sorted region keys of every cell overlapping a bounding box
+    """
+    lon_size = 360.0 / REGION_CELLS
+    lat_size = 180.0 / REGION_CELLS
+    # Clamp to the valid range and convert to cell indexes
+    first_lon = min(max(math.floor((max(min_lon, -180.0) + 180.0) / lon_size), 0), REGION_CELLS - 1)
+    last_lon = min(max(math.floor((min(max_lon, 180.0) + 180.0) / lon_size), 0), REGION_CELLS - 1)
+    first_lat = min(max(math.floor((max(min_lat, -90.0) + 90.0) / lat_size), 0), REGION_CELLS - 1)
+    last_lat = min(max(math.floor((min(max_lat, 90.0) + 90.0) / lat_size), 0), REGION_CELLS - 1)
+    return sorted(
+        _region_for_cell(lon_index, lat_index)
+        for lon_index in range(first_lon, last_lon + 1)
+        for lat_index in range(first_lat, last_lat + 1)
+    )
+
+
+def region_filter(min_lon, min_lat, max_lon, max_lat):
+    """
+    Return a Q filter restricting Business rows to the regions a bounding box overlaps
+
+    Lets PostgreSQL prune partitions for spatial queries. Returns an empty Q (no filter)
+    when partitioning is off, the box covers too many regions to be worth pruning, or it
+    crosses the antimeridian (region cells don't wrap, so some regions would be missed).
+    """
+    if not partitioning_enabled() or min_lon < -180.0 or max_lon > 180.0:
+        return Q()
+    regions = regions_for_bbox(min_lon, min_lat, max_lon, max_lat)
+    if len(regions) > MAX_PRUNING_REGIONS:
+        return Q()
+    return Q(region__in=regions)
@@ -0,0 +1,187 @@
+# Import helpers for copying cached instances, locking and timing
+import copy
+import threading
+import time
+
+# Import settings and transaction hooks
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Func
+
+# Import our models
+from .models import BusinessCategory, ReferenceDataVersion, ServiceArea
+
+
+# Default number of seconds between cross-worker version checks
+DEFAULT_CHECK_SECONDS = 5.0
+
+# Annotations that give a service area's bounding box, in extent order
+EXTENT_FUNCTIONS = {
+    "min_lon": "ST_XMin",
+    "min_lat": "ST_YMin",
+    "max_lon": "ST_XMax",
+    "max_lat": "ST_YMax",
+}
+
+
+class ReferenceCache:
+    """
+    Process-local cache of business categories and service areas
+
+    Categories and service areas change rarely but are looked up on almost every request
+    (serializer validation, within_area name resolution, category/service area filters).
+    This keeps them in memory, indexed by id, slug and name. Only the columns lookups need
+    are cached: boundaries can be large, so an area's is replaced by its bounding box and
+    callers that need the polygon query it by id. Changes in this process
+    invalidate it straight away (see lbs_app/signals.py); changes made by other gunicorn
+    workers are picked up by comparing a version token stored in the database, checked
+    at most every REFERENCE_CACHE_CHECK_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _check_seconds(self):
+        return getattr(settings, "REFERENCE_CACHE_CHECK_SECONDS", DEFAULT_CHECK_SECONDS)
+
+    def _load(self):
+        # Index every category and service area the ways callers look them up.
+        # Instances are loaded with only() so other fields (notably the boundary) stay
+        # deferred; the bounding box is computed in SQL instead.
+        categories = list(BusinessCategory.objects.only("pk", "name", "slug"))
+        areas = list(
+            ServiceArea.objects.only("pk", "name").annotate(**{
+                bound: Func(F("boundary"), function=function, output_field=FloatField())
+                for bound, function in EXTENT_FUNCTIONS.items()
+            })
+        )
+        return {
+            "categories": {category.pk: category for category in categories},
+            "categories_by_slug": {category.slug: category for category in categories},
+            "areas": {area.pk: area for area in areas},
+            "areas_by_name": {area.name: area for area in areas},
+            "areas_by_lower_name": {area.name.lower(): area for area in areas},
+            "area_bboxes": {area.pk: tuple(getattr(area, bound) for bound in EXTENT_FUNCTIONS) for area in areas},
+        }
+
+    def _get(self):
+        """
+        Return the cached data, reloading it if another worker changed the reference tables
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._data is not None and now - self._checked_at < self._check_seconds():
+                return self._data
+            version = ReferenceDataVersion.current()
+            if self._data is None or version != self._version:
+                self._data = self._load()
+                self._version = version
+            self._checked_at = now
+            return self._data
+
+    def invalidate(self):
+        """
+        Drop the cached data so the next lookup reloads it
+        """
+        with self._lock:
+            self._data = None
+
+    def changed(self):
+        """
+        Record that categories or service areas changed
+
+        Bumps the shared version token (so other workers reload) and invalidates this
+        process's copy now and again once the transaction commits.
+        """
+        ReferenceDataVersion.bump()
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+    # Lookups return copies so callers can't modify the shared instances. The copies only
+    # have their cached fields loaded (enough to assign as a foreign key); reading any
+    # other field, such as a service area's boundary, queries the database.
+
+    def category(self, pk):
+        """
+        Return the category with this id, or None if it doesn't exist
+        """
+        category = self._get()["categories"].get(pk)
+        if category is None:
+            # Miss: it may have just been created by another worker
+            return BusinessCategory.objects.filter(pk=pk).first()
+        return copy.copy(category)
+
+    def category_by_slug(self, slug):
+        """
+        Return the category with this slug, or None if it doesn't exist
+        """
+        category = self._get()["categories_by_slug"].get(slug)
+        if category is None:
+            return BusinessCategory.objects.filter(slug=slug).first()
+        return copy.copy(category)
+
+    def service_area(self, pk):
+        """
+        Return the service area with this id, or None if it doesn't exist
+        """
+        area = self._get()["areas"].get(pk)
+        if area is None:
+            return ServiceArea.objects.filter(pk=pk).first()
+        return copy.copy(area)
+
+    def service_area_by_name(self, name, case_sensitive=True):
+        """
+        Return the service area with this name, or None if it doesn't exist
+
+        Case-insensitive misses fall back to name__iexact, served by the UPPER(name) index.
+        """
+        data = self._get()
+        if case_sensitive:
+            area = data["areas_by_name"].get(name)
+            if area is None:
+                return ServiceArea.objects.filter(name=name).first()
+        else:
+            area = data["areas_by_lower_name"].get(name.lower())
+            if area is None:
+                return ServiceArea.objects.filter(name__iexact=name).first()
+        return copy.copy(area)
+
+    def service_area_bbox(self, pk):
+        """
+        Return a service area's bounding box as (min_lon, min_lat, max_lon, max_lat)
+        """
+        bbox = self._get()["area_bboxes"].get(pk)
+        if bbox is None:
+            area = ServiceArea.objects.only("boundary").filter(pk=pk).first()
+            return area.boundary.extent if area else None
+        return bbox
+
+    def existing_category_ids(self, ids):
+        """
+        Return which of these category ids exist, querying only for cache misses
+        """
+        cached = self._get()["categories"]
+        missing = {pk for pk in ids if pk not in cached}
+        found = set(ids) - missing
+        if missing:
+            found |= set(BusinessCategory.objects.filter(pk__in=missing).values_list("pk", flat=True))
+        return found
+
+    def existing_service_area_ids(self, ids):
+        """
+        Return which of these service area ids exist, querying only for cache misses
+        """
+        cached = self._get()["areas"]
+        missing = {pk for pk in ids if pk not in cached}
+        found = set(ids) - missing
+        if missing:
+            found |= set(ServiceArea.objects.filter(pk__in=missing).values_list("pk", flat=True))
+        return found
+
+
+# The process-wide cache instance
+reference_cache = ReferenceCache()
+
@@ -1,9 +1,13 @@
+# Import json to turn GeoJSON dictionaries back into text for GEOS
+import json
 # Import REST Framework serializers for API data conversion
 from rest_framework import serializers
-# Import Point geometry type for validation
-from django.contrib.gis.geos import Point
+# Import geometry types for validation
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, Point
 # Import our models
 from .models import Business, BusinessCategory, ServiceArea
+# Import the reference cache for category and service area lookups
+from .reference_cache import reference_cache
 
 
 class GeoJSONField(serializers.Field):
@@ -13,7 +17,13 @@ class GeoJSONField(serializers.Field):
     By default, PostGIS returns WKT (Well-Known Text) format like "SRID=4326;POINT(-6.26 53.34)".
     This custom field converts it to standard GeoJSON format that JavaScript map libraries expect:
     {"type": "Point", "coordinates": [-6.26, 53.34]}
+    Pass geom_type to only accept one kind of geometry when writing (e.g. "Point").
     """
+    def __init__(self, geom_type=None, **kwargs):
+        # Geometry type accepted by to_internal_value (None accepts any)
+        self.geom_type = geom_type
+        super().__init__(**kwargs)
+
     def to_representation(self, value):
         # If we have a geometry value, convert it to GeoJSON format
         if value:
@@ -24,6 +34,48 @@ class GeoJSONField(serializers.Field):
         # Return None if there's no geometry
         return None
 
+    def to_internal_value(self, data):
+        # Accept a GeoJSON dictionary like {"type": "Point", "coordinates": [-6.26, 53.34]}
+        if not isinstance(data, dict):
+            raise serializers.ValidationError("Expected a GeoJSON geometry object.")
+        try:
+            geometry = GEOSGeometry(json.dumps(data), srid=4326)
+        except (GEOSException, ValueError, TypeError):
+            raise serializers.ValidationError("Invalid GeoJSON geometry.")
+        # Other types would reach code that reads point coordinates (grid cells, region)
+        if self.geom_type and geometry.geom_type != self.geom_type:
+            raise serializers.ValidationError(
+                f"Expected a GeoJSON {self.geom_type}, got {geometry.geom_type}."
+            )
+        # GeoJSON coordinates are always WGS84
+        geometry.srid = 4326
+        return geometry
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that resolves ids through the reference cache
+
+    Categories and service areas are validated on every business write; looking them up
+    in the process-local cache avoids a query per field per request.
+    """
+    def __init__(self, lookup, **kwargs):
+        # Cache method that returns the instance for a primary key (or None)
+        self.lookup = lookup
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        instance = self.lookup(pk)
+        if instance is None:
+            self.fail("does_not_exist", pk_value=data)
+        return instance
+
 
 class BusinessCategorySerializer(serializers.ModelSerializer):
     """
@@ -60,7 +112,8 @@ class BusinessSerializer(serializers.ModelSerializer):
     # Nested serializer: when reading (GET), show full category details
     category = BusinessCategorySerializer(read_only=True)
     # Write-only field: when creating/updating (POST/PUT), accept category ID
-    category_id = serializers.PrimaryKeyRelatedField(
+    category_id = CachedPrimaryKeyRelatedField(
+        lookup=reference_cache.category,           # Resolved from the reference cache
         queryset=BusinessCategory.objects.all(),  # Valid categories user can choose from
         source="category",                         # Map this field to the category property
         write_only=True                           # Only used for writing, not reading
@@ -68,14 +121,15 @@ class BusinessSerializer(serializers.ModelSerializer):
     # Nested serializer: when reading (GET), show full service area details
     service_area = ServiceAreaSerializer(read_only=True)
     # Write-only field: when creating/updating (POST/PUT), accept service area ID
-    service_area_id = serializers.PrimaryKeyRelatedField(
+    service_area_id = CachedPrimaryKeyRelatedField(
+        lookup=reference_cache.service_area,     # Resolved from the reference cache
         queryset=ServiceArea.objects.all(),      # Valid service areas user can choose from
         source="service_area",                    # Map this field to the service_area property
         write_only=True,                          # Only used for writing, not reading
         allow_null=True                          # Service area is optional
     )
-    # Use our custom GeoJSON field to convert locations properly
-    location = GeoJSONField()
+    # Use our custom GeoJSON field to convert locations properly (points only)
+    location = GeoJSONField(geom_type="Point")
 
     class Meta:
         # Specify which model this serializer works with
@@ -93,6 +147,42 @@ class BusinessSerializer(serializers.ModelSerializer):
             "category_id",       # Category ID for updates (write-only)
             "service_area",      # Full service area details (read-only)
             "service_area_id",   # Service area ID for updates (write-only)
+            "external_id",       # Identifier in the upstream system (used for upserts)
             "created_at",
             "updated_at",
+        ]
+
+
+class BusinessBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Serializer for one record of a bulk create/update/upsert request
+
+    Foreign keys are accepted as plain integers and uniqueness isn't checked per record:
+    the bulk writer validates them for the whole batch against the reference cache.
+    """
+    # Optional primary key: when given, the record updates that business
+    id = serializers.IntegerField(required=False)
+    # Category and service area IDs, checked in bulk by the writer
+    category_id = serializers.IntegerField()
+    service_area_id = serializers.IntegerField(required=False, allow_null=True)
+    # Upstream identifier: when given (and no id), the record is upserted on it
+    external_id = serializers.CharField(max_length=100, required=False, allow_null=True)
+    # Use our custom GeoJSON field to read locations (points only)
+    location = GeoJSONField(geom_type="Point")
+
+    class Meta:
+        # Specify which model this serializer works with
+        model = Business
+        # Specify which fields a bulk record may contain
+        fields = [
+            "id",
+            "external_id",
+            "name",
+            "description",
+            "phone",
+            "email",
+            "website",
+            "location",
+            "category_id",
+            "service_area_id",
         ]
\ No newline at end of file
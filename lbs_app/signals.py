@@ -0,0 +1,136 @@
+# Import model signals used to keep derived columns up to date
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+# Import our models
+from .models import Business, BusinessCategory, BusinessTombstone, ServiceArea
+# Import the reference cache so category and service area changes invalidate it
+from .reference_cache import reference_cache
+# Import the job queue for work too heavy to run inside a request
+from .jobs import enqueue
+
+
+@receiver(pre_save, sender=Business)
+def assign_business_grid_cells(sender, instance, **kwargs):
+    """
+    Recompute a business's grid cells and region from its location before it is written
+
+    Runs for normal saves and for raw saves (loaddata), so fixtures get them too.
+    """
+    instance.assign_grid_cells()
+    instance.assign_region()
+
+
+@receiver(post_delete, sender=Business)
+def record_business_tombstone(sender, instance, **kwargs):
+    """
+    Leave a tombstone for a deleted business so the change feed can report the delete
+    """
+    BusinessTombstone.objects.create(business_id=instance.pk, external_id=instance.external_id)
+
+
+# Category and service area fields that businesses embed in API responses
+EMBEDDED_FIELDS = {
+    BusinessCategory: ["name", "slug", "description"],
+    ServiceArea: ["name", "boundary"],
+}
+
+
+@receiver(pre_save, sender=BusinessCategory)
+@receiver(pre_save, sender=ServiceArea)
+def detect_embedded_field_changes(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Note whether a save changes any field that businesses embed (see touch_related_businesses)
+
+    Categories and service areas are saved rarely, so comparing against the stored row
+    costs one primary key lookup per save.
+    """
+    instance._embedded_fields_changed = False
+    fields = [field for field in EMBEDDED_FIELDS[sender] if update_fields is None or field in update_fields]
+    if raw or instance.pk is None or not fields:
+        return
+    stored = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._embedded_fields_changed = stored is not None and any(
+        stored[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=BusinessCategory)
+@receiver(post_save, sender=ServiceArea)
+def touch_related_businesses(sender, instance, created, raw=False, **kwargs):
+    """
+    Queue putting a changed category's or service area's businesses back in the change feed
+
+    Touching can update millions of rows, so it runs in a background job, and only when a
+    field businesses embed actually changed.
+    """
+    if created or raw or not getattr(instance, "_embedded_fields_changed", False):
+        return
+    relation = "category" if sender is BusinessCategory else "service_area"
+    enqueue(
+        "touch_businesses",
+        {"relation": relation, "pk": instance.pk},
+        dedup_key=f"touch_businesses:{relation}:{instance.pk}",
+    )
+
+
+@receiver(pre_delete, sender=ServiceArea)
+def unassign_service_area_businesses(sender, instance, **kwargs):
+    """
+    Unassign a deleted service area's businesses and put them back in the change feed
+
+    The delete's SET_NULL clears their service area with a plain UPDATE that leaves
+    updated_at alone. Doing it here first, with updated_at, in the same transaction
+    leaves that UPDATE nothing to do, so the rows are still written only once.
+    """
+    Business.objects.filter(service_area=instance).update(service_area=None, updated_at=timezone.now())
+
+
+@receiver(post_save, sender=BusinessCategory)
+@receiver(post_delete, sender=BusinessCategory)
+@receiver(post_save, sender=ServiceArea)
+@receiver(post_delete, sender=ServiceArea)
+def invalidate_reference_cache(sender, instance, **kwargs):
+    """
+    Tell every worker's reference cache that categories or service areas changed
+    """
+    reference_cache.changed()
+
+
+@receiver(post_save, sender=ServiceArea)
+def queue_service_area_recompute(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Queue re-deriving a service area's businesses when its boundary may have changed
+
+    Runs in a background worker (python manage.py run_workers) so saving a large polygon
+    in the admin or API doesn't wait for every business to be checked.
+    """
+    if raw or (update_fields is not None and "boundary" not in update_fields):
+        return
+    enqueue(
+        "recompute_service_area",
+        {"service_area_id": instance.pk},
+        dedup_key=f"recompute_service_area:{instance.pk}",
+    )
+
+
+@receiver(post_save, sender=Business)
+def queue_business_service_area(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """
+    Queue filling in a business's service area when it is created or moved without one
+
+    Businesses with a service area keep it (it may have been chosen explicitly). Saves
+    that don't change the location (e.g. renaming) queue nothing.
+    """
+    if raw or (update_fields is not None and "location" not in update_fields):
+        return
+    moved = created or instance.location_changed()
+    instance.remember_location()
+    if not moved or instance.service_area_id is not None:
+        return
+    enqueue(
+        "assign_business_service_area",
+        {"business_ids": [instance.pk]},
+        dedup_key=f"assign_business_service_area:{instance.pk}",
+    )
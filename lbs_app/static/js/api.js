@@ -17,6 +17,26 @@ const Api = {
         return data.results || data;
     },
     
+    /**
+     * Fetch businesses changed or deleted since a watermark (change feed)
+     * @param {string|null} since - Watermark timestamp from the previous call (null for a full sync)
+     * @param {number} sinceId - Watermark id from the previous call
+     * @param {number|null} sinceDeletedId - Last tombstone id from the previous call (null if unknown)
+     * @returns {Promise<Object>} {changed, deleted, since, since_id, since_deleted_id, has_more}
+     */
+    async fetchChanges(since = null, sinceId = 0, sinceDeletedId = null) {
+        let url = "/api/businesses/changes/?limit=1000";
+        if (since) {
+            url += `&since=${encodeURIComponent(since)}&since_id=${sinceId}`;
+        }
+        if (since && sinceDeletedId != null) {
+            url += `&since_deleted_id=${sinceDeletedId}`;
+        }
+        const response = await fetch(url);
+        if (!response.ok) throw new Error("Failed to fetch business changes");
+        return response.json();
+    },
+    
     /**
      * Fetch businesses within a radius (Spatial Query #1: Proximity Search)
      * @param {number} lat - Latitude of the search center
@@ -0,0 +1,72 @@
+/**
+ * Client-side business cache backed by IndexedDB
+ * 
+ * Keeps a copy of every business in the browser and syncs it with the
+ * /api/businesses/changes/ feed, so page loads only download what changed
+ * since the last visit instead of the whole dataset.
+ */
+const BusinessCache = {
+    DB_NAME: "lbs_cache",
+    DB_VERSION: 1,
+    
+    /**
+     * Open (and create on first use) the IndexedDB database
+     * @returns {Promise<IDBDatabase>} The open database
+     */
+    open() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(this.DB_NAME, this.DB_VERSION);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                // Businesses keyed by id, plus a small store for the sync watermark
+                db.createObjectStore("businesses", { keyPath: "id" });
+                db.createObjectStore("meta");
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    },
+    
+    /**
+     * Run a function inside a transaction and wait for it to complete
+     * @returns {Promise<*>} Whatever the function's final request produced
+     */
+    transaction(db, stores, mode, fn) {
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(stores, mode);
+            let result;
+            const request = fn(tx);
+            if (request) request.onsuccess = () => { result = request.result; };
+            tx.oncomplete = () => resolve(result);
+            tx.onerror = () => reject(tx.error);
+        });
+    },
+    
+    /**
+     * Pull all changes since the stored watermark and return the full cached dataset
+     * @returns {Promise<Array>} Array of business objects
+     */
+    async sync() {
+        const db = await this.open();
+        let watermark = await this.transaction(db, ["meta"], "readonly",
+            tx => tx.objectStore("meta").get("watermark")) || { since: null, sinceId: 0, sinceDeletedId: null };
+        
+        // Keep pulling pages until the feed says we're up to date
+        let page;
+        do {
+            page = await Api.fetchChanges(watermark.since, watermark.sinceId, watermark.sinceDeletedId);
+            watermark = { since: page.since, sinceId: page.since_id, sinceDeletedId: page.since_deleted_id };
+            await this.transaction(db, ["businesses", "meta"], "readwrite", tx => {
+                const store = tx.objectStore("businesses");
+                page.changed.forEach(business => store.put(business));
+                page.deleted.forEach(tombstone => store.delete(tombstone.business_id));
+                return tx.objectStore("meta").put(watermark, "watermark");
+            });
+        } while (page.has_more);
+        
+        const businesses = await this.transaction(db, ["businesses"], "readonly",
+            tx => tx.objectStore("businesses").getAll());
+        // Match the API's default ordering (alphabetical by name)
+        return businesses.sort((a, b) => a.name.localeCompare(b.name));
+    }
+};
@@ -59,9 +59,16 @@ document.addEventListener("DOMContentLoaded", async function() {
     }
     
     // Load all businesses on initial load
+    // Uses the IndexedDB cache (only downloading changes) and falls back to a full fetch
     async function loadInitialBusinesses() {
         try {
-            const businesses = await Api.fetchBusinesses();
+            let businesses;
+            try {
+                businesses = await BusinessCache.sync();
+            } catch (cacheError) {
+                console.warn("Business cache unavailable, fetching all businesses:", cacheError);
+                businesses = await Api.fetchBusinesses();
+            }
             refreshMarkers(businesses);
         } catch (error) {
             console.error("Error loading businesses:", error);
@@ -0,0 +1,89 @@
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point, Polygon
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from lbs_app.models import Business, BusinessCategory, ServiceArea
+
+
+class BusinessAdminQueryTests(TestCase):
+    def setUp(self):
+        """Set up an admin user and a handful of related rows"""
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "secret-pass")
+        self.client.force_login(self.user)
+        self.category = BusinessCategory.objects.create(name="Restaurant", slug="restaurant")
+        self.service_area = ServiceArea.objects.create(
+            name="City Centre",
+            boundary=Polygon((
+                (-6.30, 53.34),
+                (-6.20, 53.34),
+                (-6.20, 53.37),
+                (-6.30, 53.37),
+                (-6.30, 53.34),
+            ))
+        )
+
+    def create_businesses(self, count, start=0):
+        """Create businesses each with its own category and service area"""
+        for i in range(start, start + count):
+            category = BusinessCategory.objects.create(name=f"Category {i}", slug=f"category-{i}")
+            area = ServiceArea.objects.create(name=f"Area {i}", boundary=self.service_area.boundary)
+            Business.objects.create(
+                name=f"Business {i}",
+                category=category,
+                service_area=area,
+                location=Point(-6.26 + i * 0.001, 53.35)
+            )
+
+    def count_queries(self, url, params=None):
+        """Request an admin page and return the number of SQL queries it ran"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_query_count_is_constant(self):
+        """Test that the changelist doesn't run a query per business or per service area"""
+        url = reverse("admin:lbs_app_business_changelist")
+        self.create_businesses(2)
+        baseline = self.count_queries(url)
+        self.create_businesses(20, start=2)
+        # Only the category filter lists rows; it adds no queries as categories grow
+        self.assertEqual(self.count_queries(url), baseline)
+
+    def test_add_form_doesnt_load_foreign_key_choices(self):
+        """Test that category and service area use autocomplete instead of full dropdowns"""
+        url = reverse("admin:lbs_app_business_add")
+        baseline = self.count_queries(url)
+        self.create_businesses(20)
+        self.assertEqual(self.count_queries(url), baseline)
+        response = self.client.get(url)
+        self.assertNotContains(response, "Area 19")
+
+    def test_changelist_bbox_filter(self):
+        """Test filtering the changelist to a map viewport"""
+        self.create_businesses(3)
+        response = self.client.get(
+            reverse("admin:lbs_app_business_changelist"),
+            {"bbox": "-6.2595,53.3,-6.2585,53.4"}
+        )
+        self.assertEqual(
+            [business.name for business in response.context["cl"].result_list],
+            ["Business 1"]
+        )
+
+    def test_changelist_searches_description(self):
+        """Test that the changelist search matches business descriptions"""
+        Business.objects.create(
+            name="Plain Name",
+            description="Wood-fired pizza",
+            category=self.category,
+            location=Point(-6.26, 53.35)
+        )
+        response = self.client.get(reverse("admin:lbs_app_business_changelist"), {"q": "pizza"})
+        self.assertEqual(
+            [business.name for business in response.context["cl"].result_list],
+            ["Plain Name"]
+        )
@@ -1,9 +1,18 @@
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
 from django.contrib.gis.geos import Point, Polygon
+from django.core.management import call_command
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from lbs_app.models import Business, BusinessCategory, ServiceArea
+from lbs_app.export import EXPORT_COLUMNS
+from lbs_app.models import Business, BusinessCategory, Job, ServiceArea
 
 
 class BusinessAPITests(APITestCase):
@@ -58,4 +67,313 @@ class BusinessAPITests(APITestCase):
             "limit": 3
         })
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
\ No newline at end of file
+        self.assertGreaterEqual(len(response.data), 1)
+        # A limit below 1 is rejected rather than failing the radius step
+        for limit in (0, -1):
+            response = self.client.get(reverse("business-nearest"), {"lat": 53.35, "lon": -6.26, "limit": limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_nearest_uses_true_distance(self):
+        """Test that nearest ranks by meters, not by planar distance in degrees"""
+        # At 53.3N a degree of longitude is ~66.5km and a degree of latitude ~111km:
+        # the north business is closer in degrees but farther in meters
+        east = Business.objects.create(
+            name="East Cafe",
+            category=self.category,
+            location=Point(-6.26 + 1000 / 66500, 53.30)   # ~1.0km east
+        )
+        Business.objects.create(
+            name="North Cafe",
+            category=self.category,
+            location=Point(-6.26, 53.30 + 1400 / 111200)  # ~1.4km north
+        )
+        response = self.client.get(reverse("business-nearest"), {
+            "lat": 53.30,
+            "lon": -6.26,
+            "limit": 1
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([business["id"] for business in response.data], [east.id])
+
+        response = self.client.get(reverse("business-nearest"), {
+            "lat": 53.30,
+            "lon": -6.26,
+            "limit": 2
+        })
+        self.assertEqual([business["name"] for business in response.data], ["East Cafe", "North Cafe"])
+
+    def test_grid_cells_assigned_on_save(self):
+        """Test that precomputed grid cells follow the business location"""
+        self.assertEqual(self.business.grid_cell_1, "-7:53")
+        self.assertEqual(self.business.grid_cell_2, "-63:533")
+        self.business.location = Point(-0.1278, 51.5074)
+        self.business.save(update_fields=["location"])
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.grid_cell_2, "-2:515")
+
+    def test_grid_aggregation(self):
+        """Test counting businesses per grid cell and category"""
+        response = self.client.get(reverse("business-grid"), {
+            "bbox": "-6.5,53.2,-6.0,53.5",
+            "resolution": 2
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["cells"]), 1)
+        cell = response.data["cells"][0]
+        self.assertEqual(cell["cell"], "-63:533")
+        self.assertEqual(cell["categories"], {"restaurant": 1})
+        self.assertEqual(cell["total"], 1)
+
+    def test_grid_aggregation_requires_valid_params(self):
+        """Test that grid aggregation rejects a bad bbox or resolution"""
+        response = self.client.get(reverse("business-grid"), {"bbox": "1,2,3"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("business-grid"), {
+            "bbox": "-6.5,53.2,-6.0,53.5",
+            "resolution": 9
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # A continent-sized box is too many cells at the finest resolution, but fine at a coarse one
+        response = self.client.get(reverse("business-grid"), {"bbox": "-11,35,30,60", "resolution": 3})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("business-grid"), {"bbox": "-11,35,30,60", "resolution": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_nearby_with_facets(self):
+        """Test that nearby returns facet counts when requested"""
+        response = self.client.get(reverse("business-nearby"), {
+            "lat": 53.35,
+            "lon": -6.26,
+            "radius": 1500,
+            "facets": "true"
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        facets = response.data["facets"]
+        self.assertEqual(facets["total"], 1)
+        self.assertEqual(facets["category"], [{"slug": "restaurant", "name": "Restaurant", "count": 1}])
+        self.assertEqual(facets["service_area"], [{"name": "City Centre", "count": 1}])
+
+    def test_nearby_pagination(self):
+        """Test that nearby returns one page of results when limit is passed"""
+        second = Business.objects.create(
+            name="Second Cafe",
+            category=self.category,
+            location=Point(-6.2601, 53.3501)
+        )
+        response = self.client.get(reverse("business-nearby"), {
+            "lat": 53.35,
+            "lon": -6.26,
+            "radius": 1500,
+            "limit": 1,
+            "facets": "true"
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual([business["id"] for business in response.data["results"]], [self.business.id])
+        self.assertIsNotNone(response.data["next"])
+        self.assertEqual(response.data["facets"]["total"], 2)
+
+        response = self.client.get(reverse("business-nearby"), {
+            "lat": 53.35,
+            "lon": -6.26,
+            "radius": 1500,
+            "limit": 1,
+            "offset": 1
+        })
+        self.assertEqual([business["id"] for business in response.data["results"]], [second.id])
+
+    def test_within_area_with_facets(self):
+        """Test that within_area returns facet counts when requested"""
+        response = self.client.get(reverse("business-within-area"), {
+            "name": "city centre",
+            "facets": "1"
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["facets"]["total"], 1)
+
+    def test_bulk_upsert(self):
+        """Test bulk create, update and idempotent upsert on external_id"""
+        records = [
+            {
+                "external_id": "ext-1",
+                "name": "Upstream Cafe",
+                "category_id": self.category.id,
+                "location": {"type": "Point", "coordinates": [-6.25, 53.35]}
+            },
+            {
+                "id": self.business.id,
+                "name": "Renamed Bistro",
+                "category_id": self.category.id,
+                "service_area_id": self.service_area.id,
+                "location": {"type": "Point", "coordinates": [-6.26, 53.35]}
+            },
+            {
+                "name": "Bad Category",
+                "category_id": 999999,
+                "location": {"type": "Point", "coordinates": [-6.26, 53.35]}
+            },
+        ]
+        response = self.client.post(reverse("business-bulk"), records, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["created", "updated", "error"]
+        )
+        self.assertIn("category_id", response.data["results"][2]["errors"])
+        created_id = response.data["results"][0]["id"]
+        self.assertEqual(Business.objects.get(id=created_id).grid_cell_2, "-63:533")
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.name, "Renamed Bistro")
+
+        # Sending the same external_id again updates the existing row instead of duplicating it
+        records[0]["name"] = "Upstream Cafe v2"
+        response = self.client.post(reverse("business-bulk"), {"records": records[:1]}, format="json")
+        self.assertEqual(response.data["results"][0], {"index": 0, "status": "updated", "id": created_id})
+        self.assertEqual(Business.objects.filter(external_id="ext-1").count(), 1)
+        self.assertEqual(Business.objects.get(id=created_id).name, "Upstream Cafe v2")
+
+    def test_bulk_upsert_keeps_omitted_fields(self):
+        """Test that an upsert record without optional fields leaves them unchanged"""
+        self.business.external_id = "ext-2"
+        self.business.phone = "+353 1 555 0100"
+        self.business.save()
+        response = self.client.post(reverse("business-bulk"), [{
+            "external_id": "ext-2",
+            "name": "Renamed Bistro",
+            "category_id": self.category.id,
+            "location": {"type": "Point", "coordinates": [-6.26, 53.35]},
+        }], format="json")
+        self.assertEqual(response.data["results"][0]["status"], "updated")
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.name, "Renamed Bistro")
+        self.assertEqual(self.business.phone, "+353 1 555 0100")
+        self.assertEqual(self.business.description, "Modern Irish cuisine")
+        self.assertEqual(self.business.service_area, self.service_area)
+
+    def test_location_must_be_a_point(self):
+        """Test that non-Point locations are rejected per record instead of failing the request"""
+        polygon = {"type": "Polygon", "coordinates": [[[-6.3, 53.3], [-6.2, 53.3], [-6.2, 53.4], [-6.3, 53.3]]]}
+        response = self.client.post(reverse("business-list"), {
+            "name": "Shaped Cafe",
+            "category_id": self.category.id,
+            "location": polygon,
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("location", response.data)
+        response = self.client.patch(
+            reverse("business-detail", args=[self.business.id]), {"location": polygon}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse("business-bulk"), [
+            {"name": "Shaped Cafe", "category_id": self.category.id, "location": polygon},
+            {"name": "Point Cafe", "category_id": self.category.id,
+             "location": {"type": "Point", "coordinates": [-6.25, 53.35]}},
+        ], format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["error", "created"])
+        self.assertIn("location", response.data["results"][0]["errors"])
+
+    def test_change_feed(self):
+        """Test that the change feed returns updates and deletions after a watermark"""
+        response = self.client.get(reverse("business-changes"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([business["id"] for business in response.data["changed"]], [self.business.id])
+        self.assertFalse(response.data["has_more"])
+        watermark = {
+            "since": response.data["since"],
+            "since_id": response.data["since_id"],
+            "since_deleted_id": response.data["since_deleted_id"],
+        }
+
+        # Nothing has changed since the watermark
+        response = self.client.get(reverse("business-changes"), watermark)
+        self.assertEqual(response.data["changed"], [])
+        self.assertEqual(response.data["deleted"], [])
+
+        # A deleted business shows up as a tombstone
+        business_id = self.business.id
+        self.business.delete()
+        response = self.client.get(reverse("business-changes"), watermark)
+        self.assertEqual([tombstone["business_id"] for tombstone in response.data["deleted"]], [business_id])
+
+    def test_change_feed_pages_deletions(self):
+        """Test that tombstones are paged with the same limit as changed businesses"""
+        response = self.client.get(reverse("business-changes"))
+        watermark = {
+            "since": response.data["since"],
+            "since_id": response.data["since_id"],
+            "since_deleted_id": response.data["since_deleted_id"],
+            "limit": 2,
+        }
+        businesses = [
+            Business.objects.create(name=f"Shop {i}", category=self.category, location=Point(-6.26, 53.35))
+            for i in range(3)
+        ]
+        Business.objects.filter(id__in=[business.id for business in businesses]).delete()
+
+        response = self.client.get(reverse("business-changes"), watermark)
+        self.assertEqual(len(response.data["deleted"]), 2)
+        self.assertTrue(response.data["has_more"])
+        watermark["since_deleted_id"] = response.data["since_deleted_id"]
+        response = self.client.get(reverse("business-changes"), watermark)
+        self.assertEqual([tombstone["business_id"] for tombstone in response.data["deleted"]], [businesses[2].id])
+        self.assertFalse(response.data["has_more"])
+
+    def test_change_feed_includes_reference_data_changes(self):
+        """Test that renaming a category or deleting a service area puts its businesses in the feed"""
+        response = self.client.get(reverse("business-changes"))
+        watermark = {"since": response.data["since"], "since_id": response.data["since_id"]}
+
+        # Saving without changing an embedded field queues nothing
+        self.category.save()
+        self.assertFalse(Job.objects.filter(kind="touch_businesses").exists())
+
+        self.category.name = "Dining"
+        self.category.save()
+        # The businesses are touched by a background job, not during the save
+        response = self.client.get(reverse("business-changes"), watermark)
+        self.assertEqual(response.data["changed"], [])
+        call_command("run_workers", processes=1, burst=True, stdout=StringIO(), stderr=StringIO())
+        response = self.client.get(reverse("business-changes"), watermark)
+        self.assertEqual([business["category"]["name"] for business in response.data["changed"]], ["Dining"])
+        watermark = {"since": response.data["since"], "since_id": response.data["since_id"]}
+
+        self.service_area.delete()
+        response = self.client.get(reverse("business-changes"), watermark)
+        self.assertEqual([business["service_area"] for business in response.data["changed"]], [None])
+
+    def test_export_requires_authentication(self):
+        """Test that the streaming export is only available to logged-in users"""
+        response = self.client.get(reverse("business-export"))
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_export_ndjson(self):
+        """Test streaming businesses as newline-delimited GeoJSON"""
+        user = User.objects.create_user(username="exporter", password="secret-pass")
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse("business-export"), {"output": "ndjson", "category": "restaurant"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        feature = json.loads(lines[0])
+        self.assertEqual(feature["properties"]["name"], "Test Bistro")
+        self.assertEqual(feature["geometry"]["coordinates"], [-6.26, 53.35])
+        # Timestamps use the same ISO 8601 format as the API
+        self.assertRegex(feature["properties"]["updated_at"], r"^\d{4}-\d{2}-\d{2}T[\d:.]+Z$")
+
+    def test_export_command_csv(self):
+        """Test the export command's CSV output through COPY and through a cursor"""
+        Business.objects.create(name="Second Cafe", category=self.category, location=Point(-6.25, 53.34))
+        for no_copy in (False, True):
+            with self.subTest(no_copy=no_copy), tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "businesses.csv")
+                stderr = StringIO()
+                call_command("export_businesses", format="csv", output=path, no_copy=no_copy, stderr=stderr)
+                with open(path, newline="") as export_file:
+                    rows = list(csv.reader(export_file))
+                self.assertEqual(rows[0], EXPORT_COLUMNS)
+                self.assertEqual(len(rows) - 1, 2)
+                self.assertEqual([row[2] for row in rows[1:]], ["Test Bistro", "Second Cafe"])
+                self.assertIn("Exported 2 businesses", stderr.getvalue())
@@ -0,0 +1,155 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.gis.geos import Point, Polygon
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from lbs_app.jobs import JOB_HANDLERS, claim_job, enqueue, requeue_stale_jobs, run_job
+from lbs_app.models import Business, BusinessCategory, Job, ServiceArea
+
+
+class JobQueueTests(TestCase):
+    def tearDown(self):
+        JOB_HANDLERS.pop("test_fail", None)
+        JOB_HANDLERS.pop("test_slow", None)
+
+    def test_enqueue_deduplicates_pending_jobs(self):
+        """Test that a pending job with the same dedup key is reused"""
+        first = enqueue("recompute_service_area", {"service_area_id": 1}, dedup_key="area:1")
+        second = enqueue("recompute_service_area", {"service_area_id": 1}, dedup_key="area:1")
+        self.assertEqual(first.pk, second.pk)
+        # Once the job is running, a new change queues a fresh job
+        claim_job("test")
+        third = enqueue("recompute_service_area", {"service_area_id": 1}, dedup_key="area:1")
+        self.assertNotEqual(third.pk, first.pk)
+
+    def test_failed_jobs_retry_with_backoff(self):
+        """Test that failures are retried later and give up after max_attempts"""
+        JOB_HANDLERS["test_fail"] = lambda payload, progress: 1 / 0
+        job = enqueue("test_fail", max_attempts=2)
+
+        self.assertFalse(run_job(claim_job("test")))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertGreater(job.run_after, job.started_at)
+        self.assertIn("ZeroDivisionError", job.last_error)
+        # Not due yet
+        self.assertIsNone(claim_job("test"))
+
+        Job.objects.filter(pk=job.pk).update(run_after=job.started_at)
+        self.assertFalse(run_job(claim_job("test")))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_requeued_job_is_not_finished_by_the_presumed_dead_worker(self):
+        """Test that a worker whose job was retried elsewhere can't record progress or success"""
+        job = enqueue("test_slow")
+        first = claim_job("first")
+
+        def slow(payload, progress):
+            # While this attempt runs without reporting, another worker presumes it dead
+            Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=600))
+            self.assertEqual(requeue_stale_jobs(300), 1)
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(claim_job("second").attempts, 2)
+            progress(0.5)
+
+        JOB_HANDLERS["test_slow"] = slow
+        self.assertFalse(run_job(first))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.worker, "second")
+        self.assertEqual(job.progress, 0)
+
+        # Without a progress report, finishing late doesn't overwrite the second attempt either
+        JOB_HANDLERS["test_slow"] = lambda payload, progress: None
+        self.assertFalse(run_job(first))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+
+    def test_recent_heartbeat_is_not_requeued(self):
+        """Test that a running job that reports progress is left alone"""
+        enqueue("test_slow")
+        claim_job("first")
+        self.assertEqual(requeue_stale_jobs(300), 0)
+
+
+class ServiceAreaJobTests(TestCase):
+    def setUp(self):
+        self.category = BusinessCategory.objects.create(name="Restaurant", slug="restaurant")
+        self.inside = Business.objects.create(name="Inside", category=self.category, location=Point(-6.26, 53.35))
+        self.outside = Business.objects.create(name="Outside", category=self.category, location=Point(-6.10, 53.35))
+
+    def test_service_area_save_queues_assignment(self):
+        """Test that saving a service area queues the recompute instead of running it inline"""
+        area = ServiceArea.objects.create(
+            name="City Centre",
+            boundary=Polygon(((-6.3, 53.34), (-6.2, 53.34), (-6.2, 53.37), (-6.3, 53.37), (-6.3, 53.34))),
+        )
+        self.assertTrue(Job.objects.filter(kind="recompute_service_area", status=Job.PENDING).exists())
+        self.inside.refresh_from_db()
+        self.assertIsNone(self.inside.service_area)
+
+        call_command("run_workers", processes=1, burst=True, stdout=StringIO(), stderr=StringIO())
+        self.inside.refresh_from_db()
+        self.outside.refresh_from_db()
+        self.assertEqual(self.inside.service_area, area)
+        self.assertIsNone(self.outside.service_area)
+        self.assertFalse(Job.objects.exclude(status=Job.SUCCEEDED).exists())
+
+        # Moving the boundary assigns newly covered businesses but keeps existing assignments
+        area.boundary = Polygon(((-6.3, 53.34), (-6.05, 53.34), (-6.05, 53.37), (-6.3, 53.37), (-6.3, 53.34)))
+        area.save()
+        call_command("run_workers", processes=1, burst=True, stdout=StringIO(), stderr=StringIO())
+        self.outside.refresh_from_db()
+        self.assertEqual(self.outside.service_area, area)
+
+    def test_only_new_or_moved_businesses_queue_assignment(self):
+        """Test that saves which don't change the location queue no job"""
+        Job.objects.all().delete()
+        business = Business.objects.get(pk=self.inside.pk)
+        business.name = "Renamed"
+        business.save()
+        self.assertFalse(Job.objects.exists())
+
+        business.location = Point(-6.25, 53.35)
+        business.save()
+        self.assertEqual(Job.objects.filter(kind="assign_business_service_area").count(), 1)
+        # Saving again after the move is not another move
+        Job.objects.all().delete()
+        business.save()
+        self.assertFalse(Job.objects.exists())
+
+    def test_explicit_service_areas_are_never_overwritten(self):
+        """Test that jobs only fill in businesses without a service area"""
+        area = ServiceArea.objects.create(
+            name="City Centre",
+            boundary=Polygon(((-6.3, 53.34), (-6.2, 53.34), (-6.2, 53.37), (-6.3, 53.37), (-6.3, 53.34))),
+        )
+        docklands = ServiceArea.objects.create(
+            name="Docklands",
+            boundary=Polygon(((-6.15, 53.34), (-6.05, 53.34), (-6.05, 53.37), (-6.15, 53.37), (-6.15, 53.34))),
+        )
+        # Chosen by hand although the location is in City Centre
+        self.inside.service_area = docklands
+        self.inside.save()
+        moved = Business.objects.create(name="Moved", category=self.category, location=Point(-6.12, 53.35))
+        call_command("run_workers", processes=1, burst=True, stdout=StringIO(), stderr=StringIO())
+        self.inside.refresh_from_db()
+        moved.refresh_from_db()
+        self.assertEqual(self.inside.service_area, docklands)
+        self.assertEqual(moved.service_area, docklands)
+
+        # Moving the business or the boundary keeps the assignments
+        moved.location = Point(-6.25, 53.35)
+        moved.save()
+        area.boundary = Polygon(((-6.3, 53.3), (-6.0, 53.3), (-6.0, 53.4), (-6.3, 53.4), (-6.3, 53.3)))
+        area.save()
+        call_command("run_workers", processes=1, burst=True, stdout=StringIO(), stderr=StringIO())
+        self.inside.refresh_from_db()
+        moved.refresh_from_db()
+        self.assertEqual(self.inside.service_area, docklands)
+        self.assertEqual(moved.service_area, docklands)
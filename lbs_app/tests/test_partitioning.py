@@ -0,0 +1,149 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from lbs_app.models import Business, BusinessCategory
+from lbs_app.partitioning import MAX_PRUNING_REGIONS, geohash, region_filter, regions_for_bbox
+
+
+class RegionKeyTests(SimpleTestCase):
+    def test_geohash_matches_known_values(self):
+        """Test geohash encoding against well-known geohashes"""
+        self.assertEqual(geohash(-6.2603, 53.3498, precision=6), "gc7x98")
+        self.assertEqual(geohash(-74.0060, 40.7128, precision=4), "dr5r")
+        self.assertEqual(geohash(151.2093, -33.8688), "r3")
+
+    def test_regions_for_bbox(self):
+        """Test finding the regions a bounding box overlaps"""
+        self.assertEqual(regions_for_bbox(-6.5, 53.2, -6.0, 53.5), ["gc"])
+        self.assertEqual(regions_for_bbox(-10, 50, 5, 56), ["gb", "gc", "u0", "u1"])
+
+    def test_region_filter_only_when_partitioned(self):
+        """Test that region predicates are only added to partitioned tables"""
+        self.assertEqual(region_filter(-6.5, 53.2, -6.0, 53.5), Q())
+        with override_settings(BUSINESS_PARTITIONING=True):
+            self.assertEqual(region_filter(-6.5, 53.2, -6.0, 53.5), Q(region__in=["gc"]))
+            # Huge boxes aren't worth pruning
+            self.assertGreater(len(regions_for_bbox(-180, -90, 180, 90)), MAX_PRUNING_REGIONS)
+            self.assertEqual(region_filter(-180, -90, 180, 90), Q())
+            # Boxes crossing the antimeridian aren't pruned (region cells don't wrap)
+            self.assertEqual(region_filter(179.5, -1, 180.5, 1), Q())
+
+
+class BusinessRegionTests(TestCase):
+    def test_region_assigned_on_save(self):
+        """Test that the region key follows the business location"""
+        category = BusinessCategory.objects.create(name="Restaurant", slug="restaurant")
+        business = Business.objects.create(name="Test Bistro", category=category, location=Point(-6.26, 53.35))
+        self.assertEqual(business.region, "gc")
+        business.location = Point(-74.0060, 40.7128)
+        business.save(update_fields=["location"])
+        business.refresh_from_db()
+        self.assertEqual(business.region, "dr")
+
+
+@override_settings(BUSINESS_PARTITIONING=True)
+class PartitionCommandTests(TestCase):
+    # (name, lon, lat, external id) of the seeded businesses
+    SEED = [
+        ("Dublin", -6.2603, 53.3498, "ext-dublin"),
+        ("London", -0.1278, 51.5074, "ext-london"),
+        ("Paris", 2.3522, 48.8566, "ext-paris"),
+        ("New York", -74.0060, 40.7128, "ext-new-york"),
+        ("Tokyo", 139.6503, 35.6762, None),
+    ]
+
+    def setUp(self):
+        category = BusinessCategory.objects.create(name="Restaurant", slug="restaurant")
+        self.businesses = {
+            name: Business.objects.create(
+                name=name, category=category, external_id=external_id, location=Point(lon, lat)
+            )
+            for name, lon, lat, external_id in self.SEED
+        }
+        self.category = category
+        # Run the deferred foreign key checks now: PostgreSQL refuses to ALTER a table
+        # with pending trigger events, and the test case never commits
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+    def partition_counts(self):
+        """Return {partition table: row count} for the Business table"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'lbs_app_business'::regclass"
+            )
+            counts = {}
+            for (table,) in cursor.fetchall():
+                cursor.execute(f'SELECT count(*) FROM "{table}"')
+                counts[table] = cursor.fetchone()[0]
+            return counts
+
+    def test_convert_add_and_split(self):
+        """Test partitioning the table, then adding and splitting partitions"""
+        europe = [geohash(-6.2603, 53.3498), geohash(2.3522, 48.8566)]
+        self.assertEqual(europe, ["gc", "u0"])
+        max_id = max(business.id for business in self.businesses.values())
+
+        call_command("partition_businesses", "convert", stdout=StringIO())
+        self.assertEqual(self.partition_counts(), {"lbs_app_business_default": 5})
+
+        call_command("partition_businesses", "add", "europe", *europe, stdout=StringIO())
+        self.assertEqual(self.partition_counts(), {
+            "lbs_app_business_default": 2,
+            "lbs_app_business_p_europe": 3,
+        })
+
+        call_command(
+            "partition_businesses", "split", "europe", "--into", "ireland_uk:gc", "france:u0",
+            stdout=StringIO(),
+        )
+        self.assertEqual(self.partition_counts(), {
+            "lbs_app_business_default": 2,
+            "lbs_app_business_p_ireland_uk": 2,
+            "lbs_app_business_p_france": 1,
+        })
+
+        # New rows continue the id sequence and land in their region's partition
+        business = Business.objects.create(name="Cork", category=self.category, location=Point(-8.4756, 51.8985))
+        self.assertGreater(business.id, max_id)
+        self.assertEqual(self.partition_counts()["lbs_app_business_p_ireland_uk"], 3)
+
+        # Moving a business moves its row to the new region's partition
+        dublin = Business.objects.get(pk=self.businesses["Dublin"].pk)
+        dublin.location = Point(2.35, 48.85)
+        dublin.save()
+        self.assertEqual(self.partition_counts()["lbs_app_business_p_france"], 2)
+        self.assertEqual(Business.objects.count(), 6)
+
+        # external_id stays unique across regions, including after the move
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Business.objects.create(
+                name="Copy", category=self.category, external_id="ext-new-york", location=Point(-6.26, 53.35)
+            )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Business.objects.create(
+                name="Copy", category=self.category, external_id="ext-dublin", location=Point(-6.26, 53.35)
+            )
+        # Deleting a business frees its external_id
+        self.businesses["London"].delete()
+        Business.objects.create(
+            name="London 2", category=self.category, external_id="ext-london", location=Point(-0.12, 51.5)
+        )
+
+        # Foreign keys survive the conversion
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Business.objects.filter(pk=business.pk).update(category_id=0)
+
+        # The admin still lists the partitioned table
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "secret-pass"))
+        response = self.client.get(reverse("admin:lbs_app_business_changelist"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["cl"].result_count, 6)
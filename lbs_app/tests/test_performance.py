@@ -0,0 +1,230 @@
+import json
+import os
+import random
+from pathlib import Path
+
+from django.contrib.gis.geos import Point, Polygon
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from lbs_app.models import Business, BusinessCategory, ServiceArea
+from lbs_app.reference_cache import reference_cache
+
+
+# Reviewable plan expectations: the lbs_app_business indexes each endpoint's queries use
+# Regenerate with: UPDATE_PLAN_SNAPSHOTS=1 python manage.py test lbs_app.tests.test_performance
+PLAN_SNAPSHOT_PATH = Path(__file__).with_name("plan_snapshots.json")
+
+# Number of businesses seeded for the performance tests
+SEED_BUSINESSES = 2000
+
+# (name, lon, lat) city centres businesses are scattered around
+SEED_CITIES = [
+    ("Dublin", -6.2603, 53.3498),
+    ("Cork", -8.4756, 51.8985),
+    ("London", -0.1278, 51.5074),
+    ("New York", -74.0060, 40.7128),
+    ("Tokyo", 139.6503, 35.6762),
+    ("Sydney", 151.2093, -33.8688),
+]
+
+# Endpoint name -> (url name, args, query params)
+ENDPOINTS = {
+    "list": ("business-list", [], {}),
+    "search": ("business-list", [], {"search": "Zebra"}),
+    "nearby": ("business-nearby", [], {"lat": 53.3498, "lon": -6.2603, "radius": 2000}),
+    "nearby_facets": ("business-nearby", [], {"lat": 53.3498, "lon": -6.2603, "radius": 2000, "facets": "true"}),
+    "nearest": ("business-nearest", [], {"lat": 53.3498, "lon": -6.2603, "limit": 10}),
+    "within_area": ("business-within-area", [], {"name": "City Centre"}),
+    "grid": ("business-grid", [], {"bbox": "-6.5,53.2,-6.0,53.5", "resolution": 3}),
+    "changes": ("business-changes", [], {}),
+}
+
+# Endpoints that return every business by design (the plain list isn't paginated), so
+# their index scans may read the whole table
+UNBOUNDED_ENDPOINTS = {"list"}
+
+# Fixed number of SQL queries each endpoint may run, whatever the number of rows
+EXPECTED_QUERY_COUNTS = {
+    "list": 1,
+    "detail": 1,
+    "search": 1,
+    "nearby": 1,
+    "nearby_facets": 2,
+    "nearest": 2,
+    "within_area": 1,
+    "grid": 1,
+    "changes": 2,
+}
+
+
+@override_settings(REFERENCE_CACHE_CHECK_SECONDS=3600)
+class PerformanceTestCase(APITestCase):
+    """Base class that seeds a medium-sized, spatially clustered dataset"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        categories = [
+            BusinessCategory.objects.create(name="Restaurant", slug="restaurant"),
+            BusinessCategory.objects.create(name="Retail", slug="retail"),
+            BusinessCategory.objects.create(name="Services", slug="services"),
+        ]
+        cls.service_area = ServiceArea.objects.create(
+            name="City Centre",
+            boundary=Polygon((
+                (-6.28, 53.33),
+                (-6.18, 53.33),
+                (-6.18, 53.37),
+                (-6.28, 53.37),
+                (-6.28, 53.33),
+            ))
+        )
+        businesses = []
+        for i in range(SEED_BUSINESSES):
+            city, lon, lat = SEED_CITIES[i % len(SEED_CITIES)]
+            business = Business(
+                name=f"{city} Business {i}",
+                description=f"A local business in {city}",
+                category=categories[i % len(categories)],
+                service_area=cls.service_area if city == "Dublin" else None,
+                location=Point(lon + rng.uniform(-0.1, 0.1), lat + rng.uniform(-0.1, 0.1)),
+            )
+            # bulk_create skips the pre_save signal that normally assigns grid cells and region
+            business.assign_grid_cells()
+            business.assign_region()
+            businesses.append(business)
+        # One business with a unique name for the search endpoint
+        businesses[0].name = "Zebra Bistro"
+        Business.objects.bulk_create(businesses)
+        cls.business = Business.objects.get(name="Zebra Bistro")
+
+        # Refresh planner statistics so plans reflect the seeded data
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE lbs_app_business")
+
+    def setUp(self):
+        # Warm the reference cache, as it is in a running worker
+        reference_cache.invalidate()
+        reference_cache.category_by_slug("restaurant")
+
+    def get_endpoint(self, name):
+        """Request an endpoint and return the captured SQL queries"""
+        if name == "detail":
+            url, params = reverse("business-detail", args=[self.business.id]), {}
+        else:
+            url_name, args, params = ENDPOINTS[name]
+            url = reverse(url_name, args=args)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, name)
+        return [query["sql"] for query in context.captured_queries]
+
+
+class QueryCountTests(PerformanceTestCase):
+    def test_endpoint_query_counts(self):
+        """Test that every endpoint runs a fixed number of queries (no N+1 in serializers)"""
+        for name, expected in EXPECTED_QUERY_COUNTS.items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(len(self.get_endpoint(name)), expected)
+
+
+class WriteQueryCountTests(PerformanceTestCase):
+    def test_create_and_update_query_counts(self):
+        """Test that POST and PATCH run a fixed number of queries, nested data included"""
+        category = BusinessCategory.objects.get(slug="retail")
+        payload = {
+            "name": "Query Count Cafe",
+            "category_id": category.id,
+            "service_area_id": self.service_area.id,
+            "location": {"type": "Point", "coordinates": [-6.26, 53.35]},
+        }
+        # INSERT, then one query re-reading the row with its category and service area
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse("business-list"), payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["category"]["name"], "Retail")
+        self.assertEqual(response.data["service_area"]["name"], "City Centre")
+        self.assertEqual(len(context.captured_queries), 2)
+
+        # Fetch, UPDATE and the re-read
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                reverse("business-detail", args=[response.data["id"]]),
+                {"name": "Renamed Cafe", "category_id": self.business.category_id},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["category"]["id"], self.business.category_id)
+        self.assertIn("boundary", response.data["service_area"])
+        self.assertEqual(len(context.captured_queries), 3)
+
+
+class QueryPlanTests(PerformanceTestCase):
+    def explain(self, sql):
+        """Return the JSON plan PostgreSQL chooses for a query"""
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+        return json.loads(plan) if isinstance(plan, str) else plan
+
+    def walk(self, node, limited=False):
+        """Yield (node, whether a Limit node above it bounds its output) for every node in a plan tree"""
+        yield node, limited
+        limited = limited or node["Node Type"] == "Limit"
+        for child in node.get("Plans", []):
+            yield from self.walk(child, limited)
+
+    def business_plan(self, name):
+        """
+        Summarise the plans of an endpoint's queries on lbs_app_business
+
+        Returns (full scan count, sorted list of lbs_app_business indexes used). Full scans
+        are sequential scans, and index scans with neither an index condition nor a Limit
+        above them (which read the whole table in index order).
+        """
+        full_scans = 0
+        indexes = set()
+        for sql in self.get_endpoint(name):
+            if '"lbs_app_business"' not in sql:
+                continue
+            for node, limited in self.walk(self.explain(sql)[0]["Plan"]):
+                if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == "lbs_app_business":
+                    full_scans += 1
+                if node.get("Index Name", "").startswith("lbs_app_bus"):
+                    indexes.add(node["Index Name"])
+                    if "Index Cond" not in node and not limited:
+                        full_scans += 1
+        return full_scans, sorted(indexes)
+
+    def test_query_plans_use_indexes(self):
+        """Test that endpoint queries use indexes and never scan the whole business table"""
+        with open(PLAN_SNAPSHOT_PATH) as snapshot_file:
+            snapshots = json.load(snapshot_file)
+
+        observed = {}
+        with connection.cursor() as cursor:
+            # A small test table is cheap to scan; make the planner show the plan it would
+            # use at scale. A seq scan still appears if no index can serve the query.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for name in list(ENDPOINTS) + ["detail"]:
+            full_scans, indexes = self.business_plan(name)
+            observed[name] = indexes
+            if name in UNBOUNDED_ENDPOINTS:
+                continue
+            with self.subTest(endpoint=name):
+                self.assertEqual(full_scans, 0, f"{name} scans the whole lbs_app_business table")
+
+        if os.environ.get("UPDATE_PLAN_SNAPSHOTS"):
+            with open(PLAN_SNAPSHOT_PATH, "w") as snapshot_file:
+                json.dump(observed, snapshot_file, indent=2, sort_keys=True)
+                snapshot_file.write("\n")
+            return
+
+        for name, indexes in observed.items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(indexes, snapshots.get(name), f"{name} plan changed; review and update the snapshot")
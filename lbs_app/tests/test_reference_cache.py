@@ -0,0 +1,76 @@
+from django.contrib.gis.geos import Point, Polygon
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from lbs_app.models import Business, BusinessCategory, ReferenceDataVersion, ServiceArea
+from lbs_app.reference_cache import reference_cache
+
+
+@override_settings(REFERENCE_CACHE_CHECK_SECONDS=3600)
+class ReferenceCacheTests(TestCase):
+    def setUp(self):
+        self.category = BusinessCategory.objects.create(name="Restaurant", slug="restaurant")
+        self.service_area = ServiceArea.objects.create(
+            name="City Centre",
+            boundary=Polygon(((-6.3, 53.34), (-6.2, 53.34), (-6.2, 53.37), (-6.3, 53.37), (-6.3, 53.34))),
+        )
+        reference_cache.invalidate()
+
+    def test_lookups_are_served_from_memory(self):
+        """Test that warm cache lookups run no queries"""
+        reference_cache.category(self.category.pk)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(reference_cache.category_by_slug("restaurant").pk, self.category.pk)
+            self.assertEqual(reference_cache.service_area_by_name("city centre", case_sensitive=False).pk, self.service_area.pk)
+            self.assertIsNone(reference_cache.service_area_by_name("city centre"))
+            self.assertEqual(reference_cache.service_area_bbox(self.service_area.pk), (-6.3, 53.34, -6.2, 53.37))
+        # Only the case-sensitive miss falls back to the database
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_boundaries_are_not_cached(self):
+        """Test that cached service areas leave the boundary deferred, loading it only on access"""
+        area = reference_cache.service_area(self.service_area.pk)
+        self.assertIn("boundary", area.get_deferred_fields())
+        self.assertIn("description", reference_cache.category(self.category.pk).get_deferred_fields())
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(area.boundary.extent, (-6.3, 53.34, -6.2, 53.37))
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_changes_invalidate_the_cache(self):
+        """Test that saving a category or service area reloads the cache"""
+        self.assertEqual(reference_cache.service_area(self.service_area.pk).name, "City Centre")
+        self.service_area.name = "Docklands"
+        self.service_area.save()
+        self.assertEqual(reference_cache.service_area(self.service_area.pk).name, "Docklands")
+
+    def test_other_workers_changes_are_picked_up(self):
+        """Test that a version bump from another process reloads the cache after the check interval"""
+        reference_cache.category(self.category.pk)
+        # Another worker renames the category (no signal reaches this process)
+        BusinessCategory.objects.filter(pk=self.category.pk).update(slug="dining")
+        ReferenceDataVersion.bump()
+        self.assertIsNotNone(reference_cache.category_by_slug("restaurant"))
+        with override_settings(REFERENCE_CACHE_CHECK_SECONDS=0):
+            self.assertIsNone(reference_cache.category_by_slug("restaurant"))
+            self.assertEqual(reference_cache.category_by_slug("dining").pk, self.category.pk)
+
+
+class BusinessFilterTests(APITestCase):
+    def setUp(self):
+        self.category = BusinessCategory.objects.create(name="Restaurant", slug="restaurant")
+        BusinessCategory.objects.create(name="Retail", slug="retail")
+        Business.objects.create(name="Test Bistro", category=self.category, location=Point(-6.26, 53.35))
+
+    def test_category_slug_filter(self):
+        """Test filtering by category slug, including unknown slugs"""
+        response = self.client.get(reverse("business-list"), {"category__slug": "restaurant"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        response = self.client.get(reverse("business-list"), {"category__slug": "retail"})
+        self.assertEqual(len(response.data), 0)
+        response = self.client.get(reverse("business-list"), {"category__slug": "missing"})
+        self.assertEqual(len(response.data), 0)
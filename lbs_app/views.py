@@ -1,16 +1,41 @@
+# Import math helpers for converting metres to degrees
+import math
 # Import PostGIS spatial functions for distance calculations
-from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.db.models.functions import Distance, GeometryDistance
 # Import Point geometry type for creating location points
 from django.contrib.gis.geos import Point
+# Import aggregation function for grouped counts and Q for OR filters
+from django.db.models import Count, Q, Subquery
+# Import database error raised when a bulk write breaks a unique constraint
+from django.db.utils import IntegrityError
+# Import timestamp parsing helpers for the change feed watermark
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+# Import streaming response for large exports
+from django.http import StreamingHttpResponse
 # Import Django's generic view for rendering templates
 from django.views.generic import TemplateView
 # Import REST Framework components for building APIs
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+# Import the business list filters
+from .filters import BusinessFilterSet
+# Import the bulk writer for batch create/update/upsert
+from .bulk import BULK_MAX_RECORDS, bulk_write_businesses
+# Import export helpers for streaming bulk downloads
+from .export import STREAMING_FORMATS, export_queryset, iter_csv, iter_ndjson, iter_rows
+# Import region helpers for partition pruning
+from .partitioning import REGION_CELLS, partitioning_enabled, region_filter
+# Import grid helpers for density aggregation
+from .grid import GRID_RESOLUTIONS, MAX_GRID_CELLS, cell_bounds, cell_count, grid_field_name, parse_bbox
 # Import our models
-from .models import Business, BusinessCategory, ServiceArea
+from .models import Business, BusinessCategory, BusinessTombstone, ServiceArea
+# Import the reference cache for service area lookups
+from .reference_cache import reference_cache
 # Import serializers to convert models to/from JSON
 from .serializers import (
     BusinessSerializer, 
@@ -29,6 +54,17 @@ class IndexView(TemplateView):
     template_name = "lbs_app/index.html"
 
 
+class SpatialResultsPagination(LimitOffsetPagination):
+    """
+    Opt-in pagination for spatial query results
+
+    Only used when the request passes limit (and optionally offset); without it the
+    endpoints keep returning a plain list. The database returns just the requested page.
+    """
+    # Largest page a client may ask for
+    max_limit = 1000
+
+
 class BusinessViewSet(viewsets.ModelViewSet):
     """
     ViewSet for Business CRUD operations and spatial queries
@@ -43,10 +79,29 @@ class BusinessViewSet(viewsets.ModelViewSet):
     # Use our custom serializer to convert businesses to/from JSON
     serializer_class = BusinessSerializer
     # Allow filtering businesses by category slug or service area name
-    filterset_fields = ["category__slug", "service_area__name"]
+    filterset_class = BusinessFilterSet
     # Allow searching businesses by name or description
     search_fields = ["name", "description"]
 
+    def perform_create(self, serializer):
+        serializer.save()
+        self._reload_saved(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self._reload_saved(serializer)
+
+    def _reload_saved(self, serializer):
+        """
+        Helper method to re-read a saved business, with its category and service area, for the response
+
+        Category and service area ids are resolved from the reference cache, whose instances
+        only have their cached fields loaded; serializing them as is would run a query for
+        each deferred field (description, boundary, created_at). One select_related query
+        fetches everything the response shows.
+        """
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
     def _parse_point(self, request):
         """
         Helper method to parse latitude and longitude from request parameters
@@ -64,12 +119,385 @@ class BusinessViewSet(viewsets.ModelViewSet):
             # Return None if parameters are missing or not valid numbers
             return None
 
+    def _radius_in_degrees(self, point, radius):
+        """
+        Helper method to convert a radius in metres to a safe upper bound in degrees
+
+        Used for an ST_DWithin prefilter, which can use the GIST index on location (the
+        exact spherical distance check can't). Longitude degrees shrink towards the poles,
+        so the bound is widened for the latitude at the far edge of the circle.
+        """
+        # 110,574 m is the shortest length of one degree of latitude
+        lat_degrees = radius / 110574.0
+        edge_lat = min(abs(point.y) + lat_degrees, 89.9)
+        return lat_degrees / math.cos(math.radians(edge_lat))
+
+    def _dwithin_filter(self, point, degrees):
+        """
+        Helper method to build the ST_DWithin prefilter for a search circle
+
+        ST_DWithin on degrees doesn't wrap around the antimeridian or over the poles, so
+        when the circle crosses either no prefilter is used (the exact check still runs).
+        """
+        if point.x - degrees < -180 or point.x + degrees > 180 or abs(point.y) + degrees > 90:
+            return Q()
+        return Q(location__dwithin=(point, degrees))
+
+    def _region_filter_for_radius(self, point, degrees):
+        """
+        Helper method to build the region (partition pruning) filter for a search circle
+
+        Returns an empty filter when the table isn't partitioned.
+        """
+        return region_filter(point.x - degrees, point.y - degrees, point.x + degrees, point.y + degrees)
+
+    def _nearest_in_neighbouring_regions(self, queryset, point, limit):
+        """
+        Helper method to answer a nearest-N query from the regions around the point
+
+        On a partitioned table this searches only the partitions within one region cell of
+        the point. The answer is kept only if the Nth result is closer than any business
+        outside that neighbourhood could be; otherwise None is returned and the caller
+        searches everywhere. Always returns None when the table isn't partitioned.
+        """
+        if not partitioning_enabled():
+            return None
+        lon_size, lat_size = 360.0 / REGION_CELLS, 180.0 / REGION_CELLS
+        if abs(point.x) + lon_size > 180.0 or abs(point.y) + lat_size > 90.0:
+            # The neighbourhood would be clipped at the antimeridian or a pole, so it
+            # doesn't cover the distance assumed below; search everywhere instead
+            return None
+        results = list(queryset.filter(region_filter(
+            point.x - lon_size, point.y - lat_size, point.x + lon_size, point.y + lat_size
+        ))[:limit])
+        # Shortest distance (meters) from the point to the edge of the searched neighbourhood
+        edge_lat = min(abs(point.y) + lat_size, 89.9)
+        covered = min(lat_size * 110574.0, lon_size * 111320.0 * math.cos(math.radians(edge_lat)))
+        if len(results) == limit and all(business.distance.m <= covered for business in results):
+            return results
+        return None
+
+    def _parse_bbox(self, request):
+        """
+        Helper method to parse a bounding box from the request parameters
+
+        Expects bbox=min_lon,min_lat,max_lon,max_lat and converts it to a PostGIS Polygon.
+        Returns None if the parameter is missing or invalid.
+        """
+        return parse_bbox(request.query_params.get("bbox"))
+
+    def _facet_counts(self, queryset):
+        """
+        Helper method to count results by category and service area
+
+        Runs one grouped query over the same filtered queryset as the results, so the counts
+        cover every match (not just the current page) without loading any rows.
+        """
+        rows = (
+            queryset.order_by()
+            .values("category__slug", "category__name", "service_area__name")
+            .annotate(count=Count("id"))
+        )
+
+        # Fold the (category, service area) groups into one count per facet value
+        categories = {}
+        service_areas = {}
+        total = 0
+        for row in rows:
+            category = categories.setdefault(row["category__slug"], {
+                "slug": row["category__slug"],
+                "name": row["category__name"],
+                "count": 0,
+            })
+            category["count"] += row["count"]
+            area = service_areas.setdefault(row["service_area__name"], {
+                "name": row["service_area__name"],
+                "count": 0,
+            })
+            area["count"] += row["count"]
+            total += row["count"]
+
+        return {
+            "total": total,
+            "category": sorted(categories.values(), key=lambda facet: -facet["count"]),
+            "service_area": sorted(service_areas.values(), key=lambda facet: -facet["count"]),
+        }
+
+    def _spatial_response(self, request, queryset, facet_queryset):
+        """
+        Helper method to build the response for a spatial query
+
+        Paginates the results when the request passes limit (see SpatialResultsPagination),
+        and adds facet counts when the request asks for them with facets=true.
+        """
+        include_facets = request.query_params.get("facets", "").lower() in ("1", "true", "yes")
+
+        # Paginated response: facets are attached next to count/next/previous/results
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+            if include_facets:
+                response.data["facets"] = self._facet_counts(facet_queryset)
+            return response
+
+        # Unpaginated response: keep the plain list unless facets were requested
+        serializer = self.get_serializer(queryset, many=True)
+        if not include_facets:
+            return Response(serializer.data)
+        return Response({
+            "results": serializer.data,
+            "facets": self._facet_counts(facet_queryset),
+        })
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Bulk create/update/upsert: write many businesses in one request
+
+        Accepts a list of business records (or {"records": [...]}). Records with an id update
+        that business, records with an external_id are upserted on it, others are created.
+        Returns one result per record in input order.
+        Example usage: POST /api/businesses/bulk/ with [{"external_id": "abc", "name": ...}]
+        """
+        # Accept either a bare list or an object wrapping the list
+        records = request.data.get("records") if isinstance(request.data, dict) else request.data
+
+        # Validate the overall shape and size of the batch
+        if not isinstance(records, list) or not records:
+            return Response(
+                {"detail": "Expected a non-empty list of records."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(records) > BULK_MAX_RECORDS:
+            return Response(
+                {"detail": f"At most {BULK_MAX_RECORDS} records are allowed per request."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Write the batch in one transaction
+        try:
+            results = bulk_write_businesses(records)
+        except IntegrityError:
+            # e.g. an update by id moving a business onto another business's external_id
+            return Response(
+                {"detail": "Batch conflicts with existing data; nothing was written."},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response({
+            "created": sum(1 for result in results if result["status"] == "created"),
+            "updated": sum(1 for result in results if result["status"] == "updated"),
+            "errors": sum(1 for result in results if result["status"] == "error"),
+            "results": results,
+        })
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        Change feed: businesses created/updated and deleted after a watermark
+
+        Lets clients keep a local cache and pull only deltas. Pass back the returned
+        "since", "since_id" and "since_deleted_id" on the next call; repeat while
+        "has_more" is true. Omitting since returns every business (a full initial sync)
+        and no deletions.
+        Example usage: /api/businesses/changes/?since=2025-01-01T00:00:00Z&since_id=0&since_deleted_id=0&limit=500
+        """
+        # Parse the watermark (optional) from request parameters
+        since = request.query_params.get("since")
+        since_id = request.query_params.get("since_id", "0")
+        since_deleted_id = request.query_params.get("since_deleted_id")
+        limit = request.query_params.get("limit", "500")
+
+        # Validate the watermark timestamp
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response(
+                    {"detail": "since must be an ISO 8601 timestamp."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        # Validate the tie-breaking ids and page size
+        try:
+            since_id = int(since_id)
+            since_deleted_id = int(since_deleted_id) if since_deleted_id is not None else None
+            limit = max(1, min(int(limit), 1000))
+        except ValueError:
+            return Response(
+                {"detail": "since_id, since_deleted_id and limit must be integers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Fetch changed businesses in (updated_at, id) order using the updated_at index
+        # The id tie-break means rows sharing a timestamp are never skipped between pages
+        queryset = self.get_queryset().order_by("updated_at", "id")
+        if since:
+            queryset = queryset.filter(
+                Q(updated_at__gt=since) | Q(updated_at=since, id__gt=since_id)
+            )
+        # Fetch one extra row to find out whether there are more pages
+        changed = list(queryset[:limit + 1])
+        has_more = len(changed) > limit
+        changed = changed[:limit]
+
+        # Fetch deletions in tombstone id order, paged like the businesses
+        deleted = []
+        next_deleted_id = since_deleted_id
+        if since:
+            tombstones = BusinessTombstone.objects.order_by("id")
+            if since_deleted_id is not None:
+                tombstones = tombstones.filter(id__gt=since_deleted_id)
+            else:
+                # Older clients only send the business watermark
+                tombstones = tombstones.filter(deleted_at__gt=since)
+            deleted = list(tombstones.values("id", "business_id", "external_id", "deleted_at")[:limit + 1])
+            has_more = has_more or len(deleted) > limit
+            deleted = deleted[:limit]
+            if deleted:
+                next_deleted_id = deleted[-1]["id"]
+        else:
+            # Full sync: the snapshot already excludes deleted businesses; start after the latest tombstone
+            latest = BusinessTombstone.objects.order_by("-id").values_list("id", flat=True).first()
+            next_deleted_id = latest or 0
+
+        # Work out the next business watermark from the latest change seen
+        next_since, next_since_id = since, since_id
+        if changed:
+            next_since, next_since_id = changed[-1].updated_at, changed[-1].id
+
+        return Response({
+            "changed": self.get_serializer(changed, many=True).data,
+            "deleted": [
+                {key: value for key, value in tombstone.items() if key != "id"} for tombstone in deleted
+            ],
+            "since": next_since,
+            "since_id": next_since_id,
+            "since_deleted_id": next_deleted_id or 0,
+            "has_more": has_more,
+        })
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """
+        Streaming export of all businesses as CSV or NDJSON (GeoJSON features)
+
+        Rows are read through a server-side cursor and streamed as they arrive, so memory
+        use stays flat however many businesses match. Requires an authenticated user.
+        Optional filters: bbox, category (slug) and service_area (name).
+        Example usage: /api/businesses/export/?output=ndjson&category=restaurant
+        """
+        # Get the output format ("format" is reserved by DRF for renderer selection)
+        output = request.query_params.get("output", "csv")
+        if output not in STREAMING_FORMATS:
+            return Response(
+                {"detail": f"output must be one of {STREAMING_FORMATS}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Validate the optional bounding box filter
+        bbox = None
+        if request.query_params.get("bbox"):
+            bbox = self._parse_bbox(request)
+            if not bbox:
+                return Response(
+                    {"detail": "bbox must be min_lon,min_lat,max_lon,max_lat."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        queryset = export_queryset(
+            bbox=bbox,
+            category=request.query_params.get("category"),
+            service_area=request.query_params.get("service_area"),
+        )
+
+        # Stream the rows as they are read from the database
+        rows = iter_rows(queryset)
+        if output == "csv":
+            response = StreamingHttpResponse(iter_csv(rows), content_type="text/csv")
+        else:
+            response = StreamingHttpResponse(iter_ndjson(rows), content_type="application/x-ndjson")
+        response["Content-Disposition"] = f'attachment; filename="businesses.{output}"'
+        return response
+
     @action(detail=False, methods=["get"])
+    def grid(self, request):
+        """
+        Density aggregation: count businesses per grid cell and category
+
+        Groups businesses inside a bounding box by their precomputed grid cell, so heatmaps
+        can be drawn without downloading every point. One grouped query, no per-row geometry.
+        Example usage: /api/businesses/grid/?bbox=-6.5,53.2,-6.0,53.5&resolution=2
+        """
+        # Parse the bounding box from request parameters
+        bbox = self._parse_bbox(request)
+        # Get the grid resolution (default to the city-scale grid)
+        resolution = request.query_params.get("resolution", "2")
+
+        # Validate that we have a valid bounding box
+        if not bbox:
+            return Response(
+                {"detail": "bbox query param is required as min_lon,min_lat,max_lon,max_lat."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Validate that the resolution is one we precompute cells for
+        try:
+            resolution = int(resolution)
+        except ValueError:
+            resolution = None
+        if resolution not in GRID_RESOLUTIONS:
+            return Response(
+                {"detail": f"resolution must be one of {sorted(GRID_RESOLUTIONS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Bound the response size: large boxes need a coarser resolution
+        if cell_count(*bbox.extent, resolution) > MAX_GRID_CELLS:
+            return Response(
+                {"detail": f"bbox spans more than {MAX_GRID_CELLS} cells at resolution {resolution}; use a coarser resolution or a smaller bbox."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Count businesses per (cell, category) inside the bounding box
+        # The bbox filter uses the GIST index; grouping uses the precomputed cell column
+        cell_field = grid_field_name(resolution)
+        rows = (
+            Business.objects.filter(region_filter(*bbox.extent), location__within=bbox)
+            .order_by()
+            .values(cell_field, "category__slug")
+            .annotate(count=Count("id"))
+        )
+
+        # Fold the grouped rows into one entry per cell
+        cells = {}
+        for row in rows:
+            cell = row[cell_field]
+            entry = cells.setdefault(cell, {
+                "cell": cell,
+                "bounds": cell_bounds(cell, resolution),
+                "total": 0,
+                "categories": {},
+            })
+            entry["categories"][row["category__slug"]] = row["count"]
+            entry["total"] += row["count"]
+
+        return Response({
+            "resolution": resolution,
+            "cell_size": GRID_RESOLUTIONS[resolution],
+            "cells": sorted(cells.values(), key=lambda entry: entry["cell"]),
+        })
+
+    @action(detail=False, methods=["get"], pagination_class=SpatialResultsPagination)
     def nearby(self, request):
         """
         Spatial Query #1: Find businesses within a radius (proximity search)
         
         This query finds all businesses within a specified distance from a given point.
+        Add facets=true to also get counts by category and service area.
+        Add limit (and offset) to get one page of results at a time.
         Example usage: /api/businesses/nearby/?lat=53.3498&lon=-6.2603&radius=1000
         """
         # Parse the search location from request parameters
@@ -94,18 +522,22 @@ class BusinessViewSet(viewsets.ModelViewSet):
             )
         
         # Find all businesses within the specified radius
-        # location__distance_lte means "location distance less than or equal to"
+        # location__dwithin is a coarse index-assisted prefilter in degrees
+        # location__distance_lte means "location distance less than or equal to" (exact, in meters)
+        degrees = self._radius_in_degrees(point, radius)
+        filtered = self.get_queryset().filter(
+            self._region_filter_for_radius(point, degrees),  # Partition pruning (if partitioned)
+            self._dwithin_filter(point, degrees),    # Uses the GIST index
+            location__distance_lte=(point, radius)  # PostGIS spatial filter
+        )
         # annotate adds a distance field to each result showing exact distance in meters
         # order_by sorts results from closest to farthest
-        queryset = self.get_queryset().filter(
-            location__distance_lte=(point, radius)  # PostGIS spatial filter
-        ).annotate(
+        queryset = filtered.annotate(
             distance=Distance("location", point)     # Calculate exact distance
-        ).order_by("distance")                       # Sort by distance
+        ).order_by("distance", "id")                 # Sort by distance (id keeps pages stable)
         
-        # Convert results to JSON format
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        # Convert results to JSON format (with optional facet counts)
+        return self._spatial_response(request, queryset, filtered)
 
     @action(detail=False, methods=["get"])
     def nearest(self, request):
@@ -127,7 +559,7 @@ class BusinessViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Validate that limit is a valid integer
+        # Validate that limit is a positive integer
         try:
             limit = int(limit)
         except ValueError:
@@ -135,25 +567,51 @@ class BusinessViewSet(viewsets.ModelViewSet):
                 {"detail": "limit must be an integer."}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if limit < 1:
+            return Response(
+                {"detail": "limit must be at least 1."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Find the N nearest businesses
-        # annotate calculates the distance to each business
-        # order_by sorts by distance (closest first)
-        # [:limit] returns only the first N results
+        # Find N candidate businesses with a KNN search on the GIST index
+        # GeometryDistance uses the <-> operator, which orders by planar distance in degrees;
+        # away from the equator that isn't the true nearest order (a degree of longitude is
+        # shorter than a degree of latitude), so the candidates only bound the search radius
         queryset = self.get_queryset().annotate(
             distance=Distance("location", point)  # Calculate distance to each business
-        ).order_by("distance")[:limit]           # Sort and limit results
+        )
+        candidates = self._nearest_in_neighbouring_regions(
+            queryset.order_by(GeometryDistance("location", point)), point, limit
+        )
+        if candidates is None:
+            candidates = list(queryset.order_by(GeometryDistance("location", point))[:limit])
+
+        if len(candidates) < limit:
+            # Fewer businesses than asked for: the candidates are all of them
+            queryset = sorted(candidates, key=lambda business: business.distance)
+        else:
+            # The true N nearest are all within the farthest candidate's distance;
+            # fetch everything in that circle and take the N closest in meters
+            radius = max(business.distance.m for business in candidates)
+            degrees = self._radius_in_degrees(point, radius)
+            queryset = queryset.filter(
+                self._region_filter_for_radius(point, degrees),  # Partition pruning (if partitioned)
+                self._dwithin_filter(point, degrees),            # Uses the GIST index
+                location__distance_lte=(point, radius)           # Exact distance in meters
+            ).order_by("distance", "id")[:limit]
         
         # Convert results to JSON format
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-    @action(detail=False, methods=["get"])
+    @action(detail=False, methods=["get"], pagination_class=SpatialResultsPagination)
     def within_area(self, request):
         """
         Spatial Query #3: Find businesses within a polygon (containment)
         
         This query finds all businesses that are located inside a specific service area polygon.
+        Add facets=true to also get counts by category and service area.
+        Add limit (and offset) to get one page of results at a time.
         Example usage: /api/businesses/within-area/?name=City Centre
         """
         # Get the service area name from request parameters
@@ -166,10 +624,9 @@ class BusinessViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Try to find the service area by name (case-insensitive search)
-        try:
-            area = ServiceArea.objects.get(name__iexact=name)
-        except ServiceArea.DoesNotExist:
+        # Find the service area by name (case-insensitive, from the reference cache)
+        area = reference_cache.service_area_by_name(name, case_sensitive=False)
+        if area is None:
             # Return error if the service area doesn't exist
             return Response(
                 {"detail": "Service area not found."}, 
@@ -177,12 +634,17 @@ class BusinessViewSet(viewsets.ModelViewSet):
             )
         
         # Find all businesses whose location is within the service area's polygon boundary
-        # location__within is a PostGIS spatial operator that checks if a point is inside a polygon
-        queryset = self.get_queryset().filter(location__within=area.boundary)
+        # location__within is a PostGIS spatial operator that checks if a point is inside a polygon.
+        # The cache doesn't hold boundaries; a subquery fetches it by id within the same query.
+        boundary = Subquery(ServiceArea.objects.filter(pk=area.pk).values("boundary")[:1])
+        queryset = self.get_queryset().filter(
+            region_filter(*reference_cache.service_area_bbox(area.pk)),   # Partition pruning (if partitioned)
+            location__within=boundary
+        )
         
-        # Convert results to JSON format
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        # Convert results to JSON format (with optional facet counts)
+        # Ordered by name, with id breaking ties so pages don't overlap
+        return self._spatial_response(request, queryset.order_by("name", "id"), queryset)
 
 
 class BusinessCategoryViewSet(viewsets.ModelViewSet):
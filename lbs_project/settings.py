@@ -30,6 +30,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",       # Messaging framework
     "django.contrib.staticfiles",    # Static file handling
     "django.contrib.gis",            # GeoDjango for spatial database support
+    "django.contrib.postgres",       # PostgreSQL features (trigram search indexes)
     "rest_framework",                # Django REST Framework for API
     "django_filters",                # Advanced filtering for APIs
     "corsheaders",                   # Cross-Origin Resource Sharing support
@@ -123,4 +124,12 @@ REST_FRAMEWORK = {
 
 # CORS (Cross-Origin Resource Sharing) settings
 # Allow requests from these origins to access the API
-CORS_ALLOWED_ORIGINS = os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:8000").split(",")
\ No newline at end of file
+CORS_ALLOWED_ORIGINS = os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:8000").split(",")
+
+# Set to True once the Business table has been converted to region partitions
+# (python manage.py partition_businesses convert); spatial queries then add region predicates
+BUSINESS_PARTITIONING = os.getenv("BUSINESS_PARTITIONING", "False") == "True"
+
+# How often (in seconds) each worker checks whether categories or service areas changed
+# in another worker and its reference cache needs reloading
+REFERENCE_CACHE_CHECK_SECONDS = float(os.getenv("REFERENCE_CACHE_CHECK_SECONDS", "5"))